@@ -0,0 +1,42 @@
+"""
+Helpers shared by the benchmark scripts: synthetic inputs and memory measurement.
+"""
+import io
+import os
+import sys
+import wave
+import numpy as np
+from PIL import Image
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.profiling import peak_rss_mb
+
+def synthetic_pixels(width, height, seed=0):
+    """Gradients plus a checkerboard, so resampling and compression have real work to do."""
+    xx = np.arange(width, dtype=np.uint32)[np.newaxis, :]
+    yy = np.arange(height, dtype=np.uint32)[:, np.newaxis]
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    pixels[..., 0] = (xx * 255 // width + seed * 60) % 256
+    pixels[..., 1] = (yy * 255 // height + seed * 90) % 256
+    pixels[..., 2] = ((xx // 64 + yy // 64) % 2) * 200 + (seed * 20) % 56
+    return pixels
+
+def synthetic_jpeg(width, height, seed=0, quality=90):
+    """Returns the bytes of a synthetic JPEG."""
+    buffer = io.BytesIO()
+    Image.fromarray(synthetic_pixels(width, height, seed)).save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+def write_sine_wav(path, duration, frequency=440.0, sample_rate=22050, silent=False):
+    """Writes a mono 16-bit WAV file with a sine tone (or silence)."""
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    samples = np.zeros_like(t) if silent else np.sin(2 * np.pi * frequency * t) * 8000
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.astype(np.int16).tobytes())
+    return path
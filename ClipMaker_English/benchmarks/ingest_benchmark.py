@@ -0,0 +1,52 @@
+"""
+Measures decode + resize time and peak memory of resize_and_pad_image for each
+entry of INGEST_QUALITY_PROFILES on a large synthetic JPEG.
+
+Usage: python benchmarks/ingest_benchmark.py [--megapixels 48] [--repeat 3]
+"""
+import argparse
+import io
+import multiprocessing
+import time
+
+from common import peak_rss_mb, synthetic_jpeg
+from PIL import Image
+from src.constants import INGEST_QUALITY_PROFILES
+from src.utils import resize_and_pad_image
+
+def measure(quality, data, repeat, queue):
+    """Runs in a fresh process so the peak RSS belongs to this mode only."""
+    baseline = peak_rss_mb()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with Image.open(io.BytesIO(data)) as img:
+            resize_and_pad_image(img, quality=quality)
+        timings.append(time.perf_counter() - start)
+    peak = peak_rss_mb()
+    queue.put((min(timings), None if peak is None else peak - baseline))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--megapixels", type=float, default=48, help="size of the synthetic photo")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per mode, the fastest is reported")
+    args = parser.parse_args()
+
+    height = int((args.megapixels * 1e6 * 3 / 4) ** 0.5)
+    width = height * 4 // 3
+    data = synthetic_jpeg(width, height)
+    print(f"Source: {width}x{height} JPEG, {len(data) / 1e6:.1f} MB")
+    print(f"{'quality':<10} {'decode+resize':>14} {'peak RSS delta':>15}")
+
+    context = multiprocessing.get_context("spawn")
+    for quality in INGEST_QUALITY_PROFILES:
+        queue = context.Queue()
+        process = context.Process(target=measure, args=(quality, data, args.repeat, queue))
+        process.start()
+        elapsed, rss = queue.get()
+        process.join()
+        rss_text = "n/a" if rss is None else f"{rss:.0f} MB"
+        print(f"{quality:<10} {elapsed * 1000:>12.0f}ms {rss_text:>15}")
+
+if __name__ == "__main__":
+    main()
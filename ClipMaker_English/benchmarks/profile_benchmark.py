@@ -0,0 +1,105 @@
+"""
+Compares encode time and file size of the render profiles.
+
+Usage: python benchmarks/profile_benchmark.py [--slides 6] [--profiles draft,archival] [--output results.json]
+
+Renders the same synthetic Custom Clip (image slides, text and solid colors with
+a sine soundtrack) once per profile into an empty segment cache and prints a
+table of wall time, encode time (the 'encode' and 'sharded encode' stages) and
+output size.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from common import synthetic_jpeg, write_sine_wav
+from src.constants import RENDER_PROFILES, TRANSITIONS
+from src.cache import segment_cache, audio_cache
+from src.pipeline import render_custom_clip
+from src.profiling import RenderProfiler
+
+SLIDE_DURATION = 3.0
+TRANSITION_DURATION = 1.0
+SLIDE_COLORS = ['#1e3c72', '#ff6b6b', '#2a9d8f']
+
+def make_slides(work_dir, count):
+    """Alternates photo slides, captioned photos and captioned solid colors."""
+    slides = []
+    for i in range(count):
+        kind = i % 3
+        content = None
+        if kind != 2:
+            content = os.path.join(work_dir, f"image_{i:02d}.jpg")
+            with open(content, "wb") as f:
+                f.write(synthetic_jpeg(2400, 1600, seed=i))
+        slides.append({
+            'type': 'solid color' if kind == 2 else 'image',
+            'content': content,
+            'color': SLIDE_COLORS[i % len(SLIDE_COLORS)],
+            'duration': SLIDE_DURATION,
+            'transition': TRANSITIONS[(i - 1) % len(TRANSITIONS)],
+            'transition_duration': TRANSITION_DURATION,
+            'text': f"Slide {i + 1}" if kind != 0 else '',
+            'text_color': '#ffffff',
+        })
+    return slides
+
+def run_profile(name, slides, audio, work_dir):
+    segment_cache.directory = os.path.join(work_dir, f"segments_{name}")
+    output = os.path.join(work_dir, f"{name}.mp4")
+    profiler = RenderProfiler()
+    render_custom_clip(slides, audio, output, profiler=profiler, profile=name)
+    report = profiler.report()
+    encode = sum(stage['wall'] for stage in report['stages'] if stage['stage'] in ('encode', 'sharded encode'))
+    settings = RENDER_PROFILES[name]
+    return {
+        'profile': name,
+        'size': list(settings['size']),
+        'fps': settings['fps'],
+        'encoder': settings['encoder'],
+        'wall': report['wall'],
+        'encode': round(encode, 4),
+        'bytes': os.path.getsize(output),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--slides", type=int, default=6, help="number of slides (default: 6)")
+    parser.add_argument("--profiles", default=",".join(RENDER_PROFILES),
+                        help="comma-separated profiles to compare (default: all)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.profiles.split(",") if name.strip()]
+    unknown = [name for name in names if name not in RENDER_PROFILES]
+    if unknown:
+        parser.error(f"unknown profile(s): {', '.join(unknown)}")
+
+    work_dir = tempfile.mkdtemp(prefix="clipmaker_profiles_")
+    results = []
+    try:
+        slides = make_slides(work_dir, args.slides)
+        duration = args.slides * SLIDE_DURATION - (args.slides - 1) * TRANSITION_DURATION
+        audio = write_sine_wav(os.path.join(work_dir, "audio.wav"), duration)
+        audio_cache.directory = os.path.join(work_dir, "audio")
+
+        print(f"{'profile':<10} {'size':>10} {'fps':>4} {'wall':>8} {'encode':>8} {'file size':>10}")
+        for name in names:
+            result = run_profile(name, slides, audio, work_dir)
+            results.append(result)
+            width, height = result['size']
+            print(f"{name:<10} {f'{width}x{height}':>10} {result['fps']:>4} {result['wall']:>7.2f}s "
+                  f"{result['encode']:>7.2f}s {result['bytes'] / 1024:>7.0f} KB")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
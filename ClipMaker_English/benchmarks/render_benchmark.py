@@ -0,0 +1,287 @@
+"""
+Times each render stage on synthetic workloads and tracks regressions.
+
+Usage: python benchmarks/render_benchmark.py [--counts 1,10,50,100] [--stages decode,encode]
+                                             [--output results.json] [--compare baseline.json]
+
+Inputs are generated locally: random-size JPEGs, solid-color slides, text
+overlays and a sine (or silent) WAV. Every (stage, count) pair runs in a fresh
+process with empty caches, so timings are cold and the peak RSS belongs to that
+stage alone. The RSS does not include the ffmpeg child processes.
+
+Stages:
+  decode       load_images on the JPEGs
+  slide_build  create_slide_image on a mix of image, color and text slides
+  composite    every frame of the timeline, without encoding
+  encode       render_timeline without audio
+  renditions   render_renditions without audio: the full size video, the 'mobile'
+               and 'vertical' presets and a poster from one composite pass
+  quick_clip   render_quick_clip end to end
+  custom_clip  render_custom_clip end to end
+  preview      generate_preview_transition for each pair of consecutive slides
+
+With --compare, any stage whose wall time or peak RSS grew by more than
+--threshold over the baseline file is reported and the exit code is 1.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import project_root, peak_rss_mb, synthetic_jpeg, write_sine_wav
+from src.constants import (
+    SCREEN_SIZE, FPS, TRANSITIONS, MAX_UPLOAD_IMAGES, PREVIEW_FORMATS,
+)
+
+STAGES = ['decode', 'slide_build', 'composite', 'encode', 'renditions', 'quick_clip', 'custom_clip', 'preview']
+DEFAULT_COUNTS = [1, 10, 50, MAX_UPLOAD_IMAGES]
+SLIDE_DURATION = 2.0
+TRANSITION_DURATION = 1.0
+SLIDE_COLORS = ['#1e3c72', '#ff6b6b', '#2a9d8f', '#f4a261', '#6a4c93']
+
+def timeline_duration(count):
+    """Length of a timeline of count slides overlapping by one transition each."""
+    return count * SLIDE_DURATION - (count - 1) * TRANSITION_DURATION
+
+def generate_inputs(work_dir, max_count, seed, silent):
+    """Writes max_count random-size JPEGs and a WAV long enough for the largest count."""
+    rng = random.Random(seed)
+    images = []
+    for i in range(max_count):
+        width = rng.randint(640, 3000)
+        height = rng.randint(480, 2000)
+        path = os.path.join(work_dir, f"image_{i:03d}.jpg")
+        with open(path, "wb") as f:
+            f.write(synthetic_jpeg(width, height, seed=i))
+        images.append(path)
+    audio = write_sine_wav(os.path.join(work_dir, "audio.wav"), timeline_duration(max_count), silent=silent)
+    return {'images': images, 'audio': audio}
+
+def make_slides(images, count):
+    """Wizard slides cycling through image, image with text, and solid color with text."""
+    slides = []
+    for i in range(count):
+        kind = i % 3
+        slides.append({
+            'type': 'solid color' if kind == 2 else 'image',
+            'content': images[i] if kind != 2 else None,
+            'color': SLIDE_COLORS[i % len(SLIDE_COLORS)],
+            'duration': SLIDE_DURATION,
+            'transition': TRANSITIONS[(i - 1) % len(TRANSITIONS)],
+            'transition_duration': TRANSITION_DURATION,
+            'text': f"Slide {i + 1}" if kind != 0 else '',
+            'text_color': '#ffffff',
+        })
+    return slides
+
+def make_layers(arrays):
+    """Timeline layers laid out like make_slides, from prepared frames."""
+    from src.renderer import make_layer
+    layers = []
+    for i, array in enumerate(arrays):
+        start = i * (SLIDE_DURATION - TRANSITION_DURATION)
+        trans_type = TRANSITIONS[(i - 1) % len(TRANSITIONS)] if i > 0 else None
+        layers.append(make_layer(array, start, SLIDE_DURATION, trans_type, TRANSITION_DURATION))
+    return layers
+
+class NullWriter:
+    """Accepts frames like FrameWriter and discards them."""
+
+    def __init__(self, size):
+        import numpy as np
+        self.buffer = np.empty((size[1], size[0], 3), dtype=np.uint8)
+
+    def acquire(self):
+        return self.buffer
+
+    def submit(self, frame):
+        pass
+
+    def write(self, frame):
+        pass
+
+def run_stage(stage, count, inputs, seed, queue):
+    """Runs one stage in a fresh process and puts its result on the queue."""
+    sys.path.insert(0, project_root)
+    from src.cache import slide_cache, segment_cache, preview_cache, audio_cache
+    from src.ingest import load_images
+    from src.utils import create_slide_image
+    from src.renderer import render_frames, render_timeline, render_renditions
+    from src.renditions import make_rendition, preset_rendition
+    from src.plan import compile_plan
+    from src.pipeline import render_quick_clip, render_custom_clip
+
+    scratch = tempfile.mkdtemp(prefix="clipmaker_bench_")
+    # Point the shared caches at empty directories so nothing is reused between stages
+    # (the audio cache also holds the beat analyses)
+    segment_cache.directory = os.path.join(scratch, "segments")
+    preview_cache.directory = os.path.join(scratch, "previews")
+    audio_cache.directory = os.path.join(scratch, "audio")
+
+    images = inputs['images'][:count]
+    slides = make_slides(inputs['images'], count)
+    output = os.path.join(scratch, "output.mp4")
+    frames = int(timeline_duration(count) * FPS)
+    try:
+        layers = None
+        if stage in ('composite', 'encode', 'renditions'):
+            layers = make_layers([create_slide_image(slide) for slide in slides])
+            plan = compile_plan(layers, timeline_duration(count), FPS)
+            slide_cache.clear()
+
+        start_rss = peak_rss_mb()
+        start = time.perf_counter()
+        if stage == 'decode':
+            load_images(images)
+            frames = count
+        elif stage == 'slide_build':
+            for slide in slides:
+                create_slide_image(slide)
+            frames = count
+        elif stage == 'composite':
+            render_frames(layers, plan, NullWriter(SCREEN_SIZE))
+        elif stage == 'encode':
+            render_timeline(layers, plan, output)
+        elif stage == 'renditions':
+            render_renditions(layers, plan, [
+                make_rendition(output),
+                preset_rendition('mobile', os.path.join(scratch, "mobile.mp4")),
+                preset_rendition('vertical', os.path.join(scratch, "vertical.mp4")),
+                preset_rendition('poster', os.path.join(scratch, "poster.jpg")),
+            ])
+        elif stage == 'quick_clip':
+            render_quick_clip(images, inputs['audio'], output, rng=random.Random(seed))
+        elif stage == 'custom_clip':
+            render_custom_clip(slides, inputs['audio'], output)
+        elif stage == 'preview':
+            from src.video_processor import generate_preview_transition
+            for prev_slide, curr_slide in zip(slides, slides[1:]):
+                generate_preview_transition(prev_slide, curr_slide, PREVIEW_FORMATS[0])
+            frames = count - 1
+        wall = time.perf_counter() - start
+        peak = peak_rss_mb()
+        queue.put({
+            'stage': stage,
+            'count': count,
+            'wall': wall,
+            'frames': frames,
+            'fps': frames / wall if wall > 0 else None,
+            'peak_rss_mb': peak,
+            'start_rss_mb': start_rss,
+        })
+    except Exception as e:
+        queue.put({'stage': stage, 'count': count, 'error': str(e)})
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=project_root,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, threshold):
+    """Returns a line for every result that is slower or larger than its baseline by more than threshold."""
+    previous = {(r['stage'], r['count']): r for r in baseline['results'] if 'error' not in r}
+    regressions = []
+    for result in results:
+        old = previous.get((result['stage'], result['count']))
+        if old is None or 'error' in result:
+            continue
+        for metric in ('wall', 'peak_rss_mb'):
+            if old.get(metric) and result.get(metric) and result[metric] > old[metric] * (1 + threshold):
+                change = result[metric] / old[metric] - 1
+                regressions.append(f"{result['stage']} x{result['count']}: {metric} "
+                                   f"{old[metric]:.2f} -> {result[metric]:.2f} (+{change:.0%})")
+    return regressions
+
+def parse_list(value, allowed=None):
+    items = [item.strip() for item in value.split(",") if item.strip()]
+    if allowed is not None:
+        unknown = [item for item in items if item not in allowed]
+        if unknown:
+            raise argparse.ArgumentTypeError(f"unknown stage(s): {', '.join(unknown)}")
+    return items
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--counts", type=lambda v: [int(c) for c in parse_list(v)], default=DEFAULT_COUNTS,
+                        help=f"comma-separated image counts, 1 to {MAX_UPLOAD_IMAGES}")
+    parser.add_argument("--stages", type=lambda v: parse_list(v, STAGES), default=STAGES,
+                        help="comma-separated stages to run (default: all)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for image sizes and quick clip transitions")
+    parser.add_argument("--silent", action="store_true", help="use a silent WAV instead of a sine tone")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown or growth (default: 0.10)")
+    args = parser.parse_args()
+
+    if any(count < 1 or count > MAX_UPLOAD_IMAGES for count in args.counts):
+        parser.error(f"counts must be between 1 and {MAX_UPLOAD_IMAGES}")
+
+    work_dir = tempfile.mkdtemp(prefix="clipmaker_bench_inputs_")
+    results = []
+    try:
+        print(f"Generating inputs for up to {max(args.counts)} images...", file=sys.stderr)
+        inputs = generate_inputs(work_dir, max(args.counts), args.seed, args.silent)
+
+        context = multiprocessing.get_context("spawn")
+        print(f"{'stage':<12} {'count':>5} {'wall':>9} {'fps':>9} {'peak RSS':>10}")
+        for stage in args.stages:
+            for count in args.counts:
+                if stage == 'preview' and count < 2:
+                    continue
+                queue = context.Queue()
+                process = context.Process(target=run_stage, args=(stage, count, inputs, args.seed, queue))
+                process.start()
+                result = queue.get()
+                process.join()
+                results.append(result)
+                if 'error' in result:
+                    print(f"{stage:<12} {count:>5}  failed: {result['error']}")
+                else:
+                    print(f"{stage:<12} {count:>5} {result['wall']:>8.2f}s {result['fps']:>9.1f} "
+                          f"{result['peak_rss_mb']:>7.0f} MB")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'seed': args.seed,
+            'screen_size': list(SCREEN_SIZE),
+            'fps': FPS,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failed = any('error' in result for result in results)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions against {args.compare} (threshold {args.threshold:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions against {args.compare}.")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
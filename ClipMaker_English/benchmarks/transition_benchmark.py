@@ -0,0 +1,63 @@
+"""
+Compares the NumPy transition kernels against the moviepy effect chain.
+
+Usage: python benchmarks/transition_benchmark.py [--frames 24] [--duration 1.0]
+"""
+import argparse
+import time
+import numpy as np
+
+from common import synthetic_pixels
+from moviepy import ImageClip, CompositeVideoClip
+from src.constants import SCREEN_SIZE, TRANSITIONS
+from src.transitions import TransitionKernel
+from src.video_processor import apply_transition_effect
+
+def synthetic_frame(seed):
+    """Builds a full-size test frame."""
+    return synthetic_pixels(SCREEN_SIZE[0], SCREEN_SIZE[1], seed)
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+def run(trans_type, base, top, duration, times):
+    clip_base = ImageClip(base).with_duration(duration)
+    clip_top = apply_transition_effect(ImageClip(top).with_duration(duration), trans_type, duration)
+    composite = CompositeVideoClip([clip_base, clip_top], size=SCREEN_SIZE)
+
+    start = time.perf_counter()
+    reference = [composite.get_frame(t).astype(np.uint8) for t in times]
+    moviepy_time = time.perf_counter() - start
+
+    kernel = TransitionKernel(trans_type, top, duration)
+    out = np.empty_like(base)
+    worst = float('inf')
+    start = time.perf_counter()
+    elapsed = 0.0
+    for t, expected in zip(times, reference):
+        kernel.render(base, t, out)
+        elapsed += time.perf_counter() - start
+        worst = min(worst, psnr(out, expected))
+        start = time.perf_counter()
+
+    composite.close()
+    return len(times) / moviepy_time, len(times) / elapsed, worst
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--frames", type=int, default=24, help="frames rendered per transition")
+    parser.add_argument("--duration", type=float, default=1.0, help="transition duration in seconds")
+    args = parser.parse_args()
+
+    base = synthetic_frame(0)
+    top = synthetic_frame(1)
+    times = [args.duration * i / args.frames for i in range(args.frames)]
+
+    print(f"{'transition':<12} {'moviepy fps':>12} {'kernel fps':>12} {'speedup':>8} {'min PSNR':>9}")
+    for trans_type in TRANSITIONS:
+        moviepy_fps, kernel_fps, worst = run(trans_type, base, top, args.duration, times)
+        print(f"{trans_type:<12} {moviepy_fps:>12.1f} {kernel_fps:>12.1f} {kernel_fps / moviepy_fps:>7.1f}x {worst:>8.1f}dB")
+
+if __name__ == "__main__":
+    main()
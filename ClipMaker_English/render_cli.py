@@ -0,0 +1,64 @@
+"""
+Headless batch renderer.
+
+Usage: python render_cli.py jobs.json [--workers N] [--shards N] [--profile NAME]
+                                     [--report results.json] [--cprofile DIR]
+
+See src/batch.py for the job spec format. Progress is printed to stderr and the
+results, including the time spent in each render stage, are printed to stdout as JSON.
+"""
+import argparse
+import json
+import os
+import sys
+
+from src.batch import load_job_spec, run_batch
+from src.constants import RENDER_PROFILES
+
+def main():
+    parser = argparse.ArgumentParser(description="Render Gogi Clip Maker jobs without the web UI.")
+    parser.add_argument("spec", help="job spec file (.json, .yaml or .yml)")
+    parser.add_argument("--workers", type=int, default=None, help="parallel jobs (default: number of cores)")
+    parser.add_argument("--report", help="also write the results to this JSON file")
+    parser.add_argument("--shards", type=int, help="encode each job in N processes (overrides the spec)")
+    parser.add_argument("--profile", choices=list(RENDER_PROFILES), help="render profile for every job (overrides the spec)")
+    parser.add_argument("--cprofile", metavar="DIR", help="run each job under cProfile and save <job id>.prof in DIR")
+    args = parser.parse_args()
+
+    try:
+        jobs = load_job_spec(args.spec)
+    except (OSError, ValueError) as e:
+        print(f"Invalid job spec: {e}", file=sys.stderr)
+        return 2
+
+    if args.shards:
+        for job in jobs:
+            job['shards'] = max(1, args.shards)
+
+    if args.profile:
+        for job in jobs:
+            job['render_profile'] = args.profile
+
+    if args.cprofile:
+        os.makedirs(args.cprofile, exist_ok=True)
+        for job in jobs:
+            job['cprofile'] = os.path.join(os.path.abspath(args.cprofile), f"{job['id']}.prof")
+
+    def print_result(result):
+        if result['status'] == 'ok':
+            outputs = ", ".join([result['output']] + result['renditions'])
+            print(f"[{result['id']}] done in {result['elapsed']:.1f}s -> {outputs}", file=sys.stderr)
+        else:
+            print(f"[{result['id']}] failed: {result['error']}", file=sys.stderr)
+
+    results = run_batch(jobs, workers=args.workers, on_result=print_result)
+
+    print(json.dumps(results, indent=2))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(results, f, indent=2)
+
+    return 0 if all(result['status'] == 'ok' for result in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+import json
+import os
+import re
+import subprocess
+from moviepy import AudioFileClip
+from moviepy.config import FFMPEG_BINARY
+
+from src.constants import AUDIO_CODEC
+from src.cache import audio_cache, hash_content, hash_key, link_or_copy
+from src.encoder import run_ffmpeg
+
+# Soundtracks are converted once per distinct upload: the track that gets muxed
+# (AUDIO_CODEC in an .m4a) and its duration are cached by content hash, so
+# re-rendering with the same music neither probes nor encodes the audio again.
+# Every render muxes its own link to the cached track.
+
+CODEC_PATTERN = re.compile(r"Stream #\d+:\d+.*?: Audio: (\w+)")
+
+def get_audio_duration(audio_path):
+    """Returns the duration of an audio file in seconds."""
+    audio_clip = AudioFileClip(audio_path)
+    try:
+        return audio_clip.duration
+    finally:
+        audio_clip.close()
+
+def probe_audio_codec(audio_path):
+    """Returns the codec name of the first audio stream (e.g. 'aac', 'mp3'), or None."""
+    result = subprocess.run([FFMPEG_BINARY, "-hide_banner", "-i", audio_path],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    match = CODEC_PATTERN.search(result.stderr.decode(errors='replace'))
+    return match.group(1) if match else None
+
+def prepare_audio(audio_path, directory):
+    """
+    Returns (track_path, duration) for an audio file. track_path holds a single
+    AUDIO_CODEC stream that mux_audio can copy. A source already in that codec is
+    remuxed without re-encoding; anything else is encoded once.
+    The track is linked into directory (see FileCache.pin), so trimming the cache
+    from another render cannot remove it before the render has muxed it.
+    """
+    name = hash_key({'source': hash_content(audio_path), 'codec': AUDIO_CODEC})
+    track_path = os.path.join(directory, "audio.m4a")
+    info_path = audio_cache.lookup(name + ".json")
+    duration = None
+    if info_path:
+        try:
+            with open(info_path) as f:
+                duration = json.load(f)['duration']
+        except OSError:
+            # Trimmed since the lookup
+            pass
+    if duration is not None and audio_cache.pin(name + ".m4a", track_path):
+        return track_path, duration
+
+    codec = "copy" if probe_audio_codec(audio_path) == AUDIO_CODEC else AUDIO_CODEC
+    run_ffmpeg(["-i", audio_path, "-map", "0:a:0", "-vn", "-c:a", codec, track_path])
+    duration = get_audio_duration(audio_path)
+
+    def describe(tmp_path):
+        with open(tmp_path, "w") as f:
+            json.dump({'duration': duration}, f)
+
+    audio_cache.store(name + ".m4a", lambda tmp_path: link_or_copy(track_path, tmp_path))
+    audio_cache.store(name + ".json", describe)
+    audio_cache.trim()
+    return track_path, duration
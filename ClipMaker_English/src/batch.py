@@ -0,0 +1,257 @@
+import glob
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from src.constants import (
+    TRANSITIONS, MOTIONS, DEFAULT_SLIDE_DURATION, DEFAULT_TRANSITION_DURATION, MAX_UPLOAD_IMAGES, ENCODE_SHARDS,
+    RENDER_PROFILES, DEFAULT_RENDER_PROFILE,
+)
+from src.pipeline import ProgressReporter, render_quick_clip, render_custom_clip
+from src.renditions import make_rendition, preset_rendition
+from src.profiling import RenderProfiler
+
+# Job spec format (JSON, or YAML when PyYAML is installed):
+#
+#   defaults:                      # optional, merged into every job
+#     render_profile: draft        # optional, one of RENDER_PROFILES (default: standard)
+#     encoder: {preset: fast, crf: 23}  # optional, overrides the profile's encoder settings
+#     shards: 4                    # optional, encode each job in 4 processes
+#   jobs:
+#     - id: holiday
+#       mode: quick
+#       images: photos/*.jpg       # list of paths or a glob
+#       audio: song.mp3
+#       output: out/holiday.mp4
+#       seed: 7                    # optional, makes the random transitions repeatable
+#       collapse_duplicates: true  # optional, drops near-duplicate images such as burst shots
+#       sync_to_beats: true        # optional, cuts to the next image on the beat of the audio
+#       renditions:                # optional, extra outputs encoded from the same frames
+#         - {preset: mobile, output: out/holiday_720p.mp4}   # one of RENDITION_PRESETS, at most the profile size
+#         - {output: out/holiday_vertical.mov, size: [1080, 1920], fit: crop, encoder: {crf: 24}}
+#         - {preset: poster, output: out/holiday.jpg}
+#     - id: promo
+#       mode: custom
+#       audio: music.mp3           # optional
+#       output: out/promo.mp4
+#       slides:
+#         - {type: image, content: cover.jpg, duration: 4, text: Hello, font_size: 120}
+#         - {type: color, color: "#ff0000", transition: slide_left}
+#         - {type: image, content: beach.jpg, duration: 6, motion: pan_right}   # optional, one of MOTIONS
+#
+# Relative paths are resolved against the directory of the spec file. Slides
+# may also set font (a .ttf path) and font_size (pixels at 1920x1080).
+
+SLIDE_TYPES = {'image': 'image', 'color': 'solid color', 'solid color': 'solid color'}
+
+def load_job_spec(path):
+    """
+    Reads a job spec file and returns the list of normalized jobs.
+    A spec may also be a single job or a plain list of jobs.
+    """
+    with open(path) as f:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("PyYAML is required to read YAML job specs (pip install pyyaml)")
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+
+    if isinstance(spec, list):
+        spec = {'jobs': spec}
+    elif isinstance(spec, dict) and 'jobs' not in spec:
+        spec = {'jobs': [spec]}
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    defaults = spec.get('defaults') or {}
+    jobs = [normalize_job({**defaults, **job}, i, base_dir) for i, job in enumerate(spec['jobs'])]
+    ids = [job['id'] for job in jobs]
+    if len(set(ids)) != len(ids):
+        raise ValueError("job ids must be unique")
+    return jobs
+
+def resolve_path(path, base_dir):
+    return path if os.path.isabs(path) else os.path.join(base_dir, path)
+
+def normalize_job(job, index, base_dir):
+    """Validates a job and fills in defaults. Raises ValueError on invalid specs."""
+    job_id = str(job.get('id', f"job_{index + 1}"))
+    mode = job.get('mode')
+    if mode not in ('quick', 'custom'):
+        raise ValueError(f"{job_id}: mode must be 'quick' or 'custom'")
+    if not job.get('output'):
+        raise ValueError(f"{job_id}: output is required")
+
+    normalized = {
+        'id': job_id,
+        'mode': mode,
+        'output': resolve_path(job['output'], base_dir),
+        'audio': resolve_path(job['audio'], base_dir) if job.get('audio') else None,
+        'encoder': dict(job.get('encoder') or {}),
+        'shards': int(job.get('shards', ENCODE_SHARDS)),
+        'render_profile': job.get('render_profile', DEFAULT_RENDER_PROFILE),
+    }
+    if normalized['render_profile'] not in RENDER_PROFILES:
+        raise ValueError(f"{job_id}: render_profile must be one of {', '.join(RENDER_PROFILES)}")
+    if normalized['shards'] < 1:
+        raise ValueError(f"{job_id}: shards must be at least 1")
+    normalized['renditions'] = [normalize_rendition(rendition, job_id, base_dir,
+                                                    RENDER_PROFILES[normalized['render_profile']]['size'])
+                                for rendition in job.get('renditions') or []]
+
+    if mode == 'quick':
+        images = job.get('images')
+        if isinstance(images, str):
+            images = sorted(glob.glob(resolve_path(images, base_dir)))
+        else:
+            images = [resolve_path(image, base_dir) for image in images or []]
+        if not images:
+            raise ValueError(f"{job_id}: no images")
+        if len(images) > MAX_UPLOAD_IMAGES:
+            raise ValueError(f"{job_id}: at most {MAX_UPLOAD_IMAGES} images are supported")
+        if not normalized['audio']:
+            raise ValueError(f"{job_id}: quick clips need audio")
+        normalized['images'] = images
+        normalized['seed'] = job.get('seed')
+        normalized['collapse_duplicates'] = bool(job.get('collapse_duplicates', False))
+        normalized['sync_to_beats'] = bool(job.get('sync_to_beats', False))
+    else:
+        slides = job.get('slides') or []
+        if not slides:
+            raise ValueError(f"{job_id}: no slides")
+        normalized['slides'] = [normalize_slide(slide, job_id, base_dir) for slide in slides]
+
+    return normalized
+
+def normalize_rendition(rendition, job_id, base_dir, render_size=None):
+    """
+    Turns a spec rendition into a rendition of src.renditions. Presets are
+    clamped to render_size, the frame size of the job's render profile.
+    """
+    if not rendition.get('output'):
+        raise ValueError(f"{job_id}: renditions need an output")
+    output = resolve_path(rendition['output'], base_dir)
+    try:
+        if rendition.get('preset'):
+            return preset_rendition(rendition['preset'], output, render_size)
+        return make_rendition(output, rendition.get('size'), rendition.get('fit', 'pad'), rendition.get('encoder'))
+    except ValueError as e:
+        raise ValueError(f"{job_id}: {e}")
+
+def resolve_font(font, base_dir):
+    """A font next to the spec wins; otherwise the name is left for Pillow to find."""
+    if font and os.path.exists(resolve_path(font, base_dir)):
+        return resolve_path(font, base_dir)
+    return font
+
+def normalize_slide(slide, job_id, base_dir):
+    """Turns a spec slide into the dictionary used by the wizard."""
+    slide_type = SLIDE_TYPES.get(slide.get('type', 'image'))
+    if slide_type is None:
+        raise ValueError(f"{job_id}: unknown slide type {slide.get('type')!r}")
+    transition = slide.get('transition', 'crossfade')
+    if transition not in TRANSITIONS:
+        raise ValueError(f"{job_id}: unknown transition {transition!r}")
+    motion = slide.get('motion')
+    if motion is not None and motion not in MOTIONS:
+        raise ValueError(f"{job_id}: unknown motion {motion!r}")
+    if slide_type == 'image' and not slide.get('content'):
+        raise ValueError(f"{job_id}: image slides need content")
+
+    return {
+        'type': slide_type,
+        'content': resolve_path(slide['content'], base_dir) if slide_type == 'image' else None,
+        'color': slide.get('color', '#000000'),
+        'duration': float(slide.get('duration', DEFAULT_SLIDE_DURATION)),
+        'transition': transition,
+        'transition_duration': float(slide.get('transition_duration', DEFAULT_TRANSITION_DURATION)),
+        'motion': motion,
+        'text': slide.get('text', ''),
+        'text_color': slide.get('text_color', '#ffffff'),
+        'font': resolve_font(slide.get('font'), base_dir),
+        'font_size': slide.get('font_size'),
+    }
+
+class ConsoleProgress(ProgressReporter):
+    """Prints progress lines prefixed with the job id to stderr."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.last_step = -1
+
+    def status(self, message):
+        print(f"[{self.job_id}] {message}", file=sys.stderr, flush=True)
+
+    def encoding(self, fraction):
+        step = int(fraction * 10)
+        if step > self.last_step:
+            self.last_step = step
+            print(f"[{self.job_id}] encoding {step * 10}%", file=sys.stderr, flush=True)
+
+def run_job(job, reporter=None):
+    """
+    Renders one normalized job and returns a result dictionary with its stage
+    timings. Never raises. If the job has a 'cprofile' path, the render runs under
+    cProfile and the stats are saved there. Progress goes to stderr unless a
+    ProgressReporter is given.
+    """
+    start = time.time()
+    reporter = reporter or ConsoleProgress(job['id'])
+    profiler = RenderProfiler(cprofile_path=job.get('cprofile'))
+    try:
+        renditions = job.get('renditions') or []
+        for path in [job['output']] + [rendition['path'] for rendition in renditions]:
+            output_dir = os.path.dirname(path)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+        if job['mode'] == 'quick':
+            rng = random.Random(job['seed']) if job['seed'] is not None else random
+            render_quick_clip(job['images'], job['audio'], job['output'], reporter=reporter, rng=rng,
+                              encoder_settings=job['encoder'], profiler=profiler, shards=job['shards'],
+                              profile=job['render_profile'], scratch_dir=job.get('scratch'),
+                              renditions=renditions, collapse_duplicates=job.get('collapse_duplicates', False),
+                              sync_to_beats=job.get('sync_to_beats', False))
+        else:
+            render_custom_clip(job['slides'], job['audio'], job['output'], reporter=reporter,
+                               encoder_settings=job['encoder'], profiler=profiler, shards=job['shards'],
+                               profile=job['render_profile'], scratch_dir=job.get('scratch'),
+                               renditions=renditions)
+        return {'id': job['id'], 'status': 'ok', 'output': job['output'],
+                'renditions': [rendition['path'] for rendition in renditions],
+                'elapsed': time.time() - start, 'profile': profiler.report()}
+    except Exception as e:
+        return {'id': job['id'], 'status': 'error', 'error': str(e), 'elapsed': time.time() - start,
+                'profile': profiler.report()}
+
+def run_batch(jobs, workers=None, on_result=None):
+    """
+    Renders jobs on a process pool sized to the available cores.
+    When several jobs or shards run at once, each encoder gets a share of the
+    cores unless the job sets its own thread count. Returns the results in job order.
+    """
+    cpu_count = os.cpu_count() or 1
+    workers = max(1, min(workers or cpu_count, len(jobs)))
+    for job in jobs:
+        if workers * job['shards'] > 1:
+            job['encoder'].setdefault('threads', max(1, cpu_count // (workers * job['shards'])))
+
+    results = {}
+    if workers == 1:
+        for job in jobs:
+            results[job['id']] = run_job(job)
+            if on_result:
+                on_result(results[job['id']])
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_job, job) for job in jobs]
+            for future in as_completed(futures):
+                result = future.result()
+                results[result['id']] = result
+                if on_result:
+                    on_result(result)
+    return [results[job['id']] for job in jobs]
@@ -0,0 +1,155 @@
+import json
+import numpy as np
+from moviepy import AudioFileClip
+
+from src.constants import (BEAT_SAMPLE_RATE, BEAT_CHUNK_SECONDS, BEAT_WINDOW, BEAT_HOP_LENGTH, BEAT_BANDS,
+                           BEAT_TEMPO_RANGE, BEAT_TEMPO_PRIOR, BEAT_TIGHTNESS)
+from src.cache import audio_cache, hash_content, hash_key
+
+# Beat tracking for "cut on the beat" Quick Clips. The track is decoded in
+# chunks and reduced to an onset envelope (spectral flux) on the fly, so only
+# BEAT_CHUNK_SECONDS of samples are in memory at a time. The tempo is the
+# strongest periodicity of the envelope and the beats are the onsets that best
+# keep to it (dynamic programming, after Ellis 2007). Results are cached per
+# audio content in the audio cache.
+
+def decode_chunks(audio_path, sample_rate=BEAT_SAMPLE_RATE, chunk_seconds=BEAT_CHUNK_SECONDS):
+    """Yields the samples of an audio file as mono float32 arrays of chunk_seconds."""
+    chunk_size = int(chunk_seconds * sample_rate)
+    # The reader only serves a request from one buffer when it spans at most half of it
+    clip = AudioFileClip(audio_path, fps=sample_rate, buffersize=2 * chunk_size + 2)
+    try:
+        for chunk in clip.iter_chunks(chunksize=chunk_size, fps=sample_rate):
+            chunk = np.asarray(chunk, dtype=np.float32)
+            yield chunk.mean(axis=1) if chunk.ndim > 1 else chunk
+    finally:
+        clip.close()
+
+def band_matrix(window, sample_rate, bands=BEAT_BANDS, low=30.0):
+    """Matrix averaging the rfft bins of a window into bands log-spaced from low Hz to Nyquist."""
+    frequencies = np.fft.rfftfreq(window, 1.0 / sample_rate)
+    band = np.digitize(frequencies, np.geomspace(low, sample_rate / 2, bands + 1)) - 1
+    matrix = np.zeros((len(frequencies), bands), dtype=np.float32)
+    inside = (band >= 0) & (band < bands)
+    matrix[np.flatnonzero(inside), band[inside]] = 1
+    return matrix / np.maximum(matrix.sum(axis=0), 1)
+
+def onset_envelope(chunks, sample_rate=BEAT_SAMPLE_RATE, window=BEAT_WINDOW, hop_length=BEAT_HOP_LENGTH):
+    """
+    Spectral flux of a stream of mono sample chunks: for every hop, the sum of
+    the increases of the log band energies (see band_matrix) since the previous
+    hop. Frame k is centered on sample k * hop_length + hop_length - window // 2.
+    Only the samples of an unfinished window are carried from one chunk to the next.
+    """
+    taper = np.hanning(window).astype(np.float32)
+    bands = band_matrix(window, sample_rate)
+    carry = np.zeros(window - hop_length, dtype=np.float32)
+    previous = None
+    envelope = []
+    for chunk in chunks:
+        samples = np.concatenate([carry, chunk])
+        count = (len(samples) - window) // hop_length + 1
+        if count <= 0:
+            carry = samples
+            continue
+        frames = np.lib.stride_tricks.sliding_window_view(samples, window)[::hop_length][:count]
+        spectrum = np.log1p(100 * (np.abs(np.fft.rfft(frames * taper, axis=1)) @ bands))
+        if previous is None:
+            previous = spectrum[:1]
+        envelope.append(np.maximum(np.diff(spectrum, axis=0, prepend=previous), 0).sum(axis=1))
+        previous = spectrum[-1:]
+        carry = samples[count * hop_length:]
+    return np.concatenate(envelope) if envelope else np.zeros(0)
+
+def estimate_period(envelope, frame_rate, tempo_range=BEAT_TEMPO_RANGE, prior=BEAT_TEMPO_PRIOR):
+    """
+    The beat period of an onset envelope in frames: the lag within tempo_range
+    with the strongest autocorrelation, weighted towards the prior tempo
+    (one octave away counts about half as much).
+    """
+    signal = envelope - envelope.mean()
+    autocorrelation = np.fft.irfft(np.abs(np.fft.rfft(signal, 2 * len(signal))) ** 2)
+    lags = np.arange(max(1, int(frame_rate * 60 / tempo_range[1])),
+                     min(len(signal) - 1, int(np.ceil(frame_rate * 60 / tempo_range[0]))) + 1)
+    if len(lags) == 0:
+        return frame_rate * 60 / prior
+    weight = np.exp(-0.5 * np.log2(frame_rate * 60 / lags / prior) ** 2)
+    strength = autocorrelation[lags] * weight
+    best = int(np.argmax(strength))
+    if 0 < best < len(lags) - 1:
+        # The peak of the parabola through the best lag and its neighbours
+        left, middle, right = strength[best - 1:best + 2]
+        curvature = left - 2 * middle + right
+        if curvature < 0:
+            return float(lags[best] + 0.5 * (left - right) / curvature)
+    return float(lags[best])
+
+def track_beats(envelope, period, tightness=BEAT_TIGHTNESS):
+    """
+    Frames of the beats of an onset envelope with a period in frames. Each frame
+    scores its onset strength plus the best score of a previous beat between half
+    and twice a period earlier, minus a penalty for straying from the period;
+    the beats are the best chain ending in the last period.
+    Frames are processed a half period at a time, since they only depend on
+    earlier blocks.
+    """
+    if len(envelope) == 0:
+        return np.zeros(0, dtype=int)
+    onsets = envelope / (envelope.std() or 1.0)
+    gaps = np.arange(max(1, round(period / 2)), max(2, round(2 * period)) + 1)
+    penalty = -tightness * np.log(gaps / period) ** 2
+    score = onsets.copy()
+    backlink = np.full(len(onsets), -1)
+    for start in range(gaps[0], len(onsets), gaps[0]):
+        frames = np.arange(start, min(start + gaps[0], len(onsets)))
+        previous = frames[:, None] - gaps[None, :]
+        candidates = np.where(previous >= 0, score[np.maximum(previous, 0)] + penalty, -np.inf)
+        best = candidates.argmax(axis=1)
+        score[frames] += candidates[np.arange(len(frames)), best]
+        backlink[frames] = previous[np.arange(len(frames)), best]
+
+    last = max(0, len(onsets) - round(period))
+    beats = [last + int(np.argmax(score[last:]))]
+    while backlink[beats[-1]] >= 0:
+        beats.append(backlink[beats[-1]])
+    return np.array(beats[::-1])
+
+def detect_beats(audio_path):
+    """
+    Returns {'tempo', 'beats'} for an audio file: the tempo in BPM and the beat
+    times in seconds. Computed by streaming the track, see the module comment.
+    """
+    envelope = onset_envelope(decode_chunks(audio_path))
+    if not envelope.any():
+        # Silence, or shorter than a window: nothing to follow
+        return {'tempo': None, 'beats': []}
+    frame_rate = BEAT_SAMPLE_RATE / BEAT_HOP_LENGTH
+    period = estimate_period(envelope, frame_rate)
+    frames = track_beats(envelope, period)
+    times = (frames * BEAT_HOP_LENGTH + BEAT_HOP_LENGTH - BEAT_WINDOW // 2) / BEAT_SAMPLE_RATE
+    return {
+        'tempo': round(60 * frame_rate / period, 2),
+        'beats': [round(float(t), 4) for t in times if t >= 0],
+    }
+
+def analyze_beats(audio_path):
+    """detect_beats, cached in the audio cache by the content of the file and the analysis settings."""
+    name = hash_key({
+        'source': hash_content(audio_path),
+        'sample_rate': BEAT_SAMPLE_RATE,
+        'window': BEAT_WINDOW,
+        'bands': BEAT_BANDS,
+        'hop_length': BEAT_HOP_LENGTH,
+        'tempo_range': BEAT_TEMPO_RANGE,
+        'prior': BEAT_TEMPO_PRIOR,
+        'tightness': BEAT_TIGHTNESS,
+    }) + ".beats.json"
+    path = audio_cache.lookup(name)
+    if not path:
+        def analyze(tmp_path):
+            with open(tmp_path, "w") as f:
+                json.dump(detect_beats(audio_path), f)
+        path = audio_cache.store(name, analyze)
+        audio_cache.trim()
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+from src.constants import (
+    SLIDE_CACHE_MAX_BYTES, SEGMENT_CACHE_DIR, SEGMENT_CACHE_MAX_BYTES,
+    PREVIEW_CACHE_DIR, PREVIEW_CACHE_MAX_BYTES, AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES,
+    PROXY_CACHE_DIR, PROXY_CACHE_MAX_BYTES,
+)
+
+def hash_content(content, chunk_size=1024 * 1024):
+    """
+    Returns a hex digest of a file path or a file-like object (e.g. UploadedFile).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(content, str):
+        with open(content, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+    elif hasattr(content, 'getvalue'):
+        digest.update(content.getvalue())
+    else:
+        content.seek(0)
+        for chunk in iter(lambda: content.read(chunk_size), b""):
+            digest.update(chunk)
+        content.seek(0)
+    return digest.hexdigest()
+
+def hash_key(description):
+    """Returns a hex digest of a JSON-serialisable description."""
+    encoded = json.dumps(description, sort_keys=True).encode()
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+class LRUCache:
+    """
+    Thread-safe LRU cache of numpy arrays bounded by their total size in bytes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached array or None, updating the hit/miss counters."""
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Stores an array, evicting the least recently used entries over budget."""
+        size = value.nbytes
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.current_bytes -= self.entries.pop(key).nbytes
+            self.entries[key] = value
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """Returns the hit/miss counters and the current usage."""
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self.entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+# Finished slide frames, shared by every session in the process
+slide_cache = LRUCache(SLIDE_CACHE_MAX_BYTES)
+
+def slide_cache_key(slide_data, target_size):
+    """
+    Builds the cache key of a slide: its source content plus every render parameter.
+    """
+    if slide_data['type'] == 'image':
+        source = hash_content(slide_data['content'])
+        color = None
+    else:
+        source = None
+        color = slide_data['color']
+    return (
+        slide_data['type'],
+        source,
+        color,
+        slide_data.get('text') or '',
+        slide_data.get('text_color', '#ffffff'),
+        slide_data.get('font'),
+        slide_data.get('font_size'),
+        tuple(target_size),
+    )
+
+def link_or_copy(source, destination):
+    """Hard-links source to destination, or copies it when they are on different file systems."""
+    try:
+        os.link(source, destination)
+    except OSError:
+        # A missing source fails the copy as well
+        shutil.copyfile(source, destination)
+
+class FileCache:
+    """
+    Directory of rendered files named by the hash of everything that determined
+    their content. Least recently used files are removed by trim() once the
+    directory exceeds max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def path_for(self, name):
+        return os.path.join(self.directory, name)
+
+    def lookup(self, name):
+        """Returns the path of a cached file or None, refreshing its LRU position."""
+        path = self.path_for(name)
+        try:
+            os.utime(path)
+        except OSError:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return path
+
+    def pin(self, name, destination):
+        """
+        Like lookup(), but links the cached file to destination (see link_or_copy)
+        and returns destination, so the file outlives a trim() by another process
+        while it is in use.
+        """
+        path = self.lookup(name)
+        if path is None:
+            return None
+        try:
+            link_or_copy(path, destination)
+        except FileNotFoundError:
+            # Trimmed since the lookup
+            return None
+        return destination
+
+    def store(self, name, render):
+        """
+        Calls render(tmp_path) and moves the result into the cache atomically.
+        Returns the cached path.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(name)
+        root, extension = os.path.splitext(name)
+        # Keep the extension last so ffmpeg and Pillow can infer the format
+        tmp_path = os.path.join(self.directory, f"{root}.{uuid.uuid4().hex}.tmp{extension}")
+        try:
+            render(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return path
+
+    def trim(self):
+        """Deletes the least recently used files until the budget is met."""
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if ".tmp." not in entry.name]
+        except OSError:
+            return
+        files = []
+        for entry in entries:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+# Encoded timeline segments, reused across renders of the same storyboard
+segment_cache = FileCache(SEGMENT_CACHE_DIR, SEGMENT_CACHE_MAX_BYTES)
+
+# Transition previews, keyed by the two slides and the transition
+preview_cache = FileCache(PREVIEW_CACHE_DIR, PREVIEW_CACHE_MAX_BYTES)
+
+# Soundtracks converted for muxing, keyed by the content of the upload
+audio_cache = FileCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES)
+
+# Small slide images shown by the wizard, keyed by the slide and the proxy size
+proxy_cache = FileCache(PROXY_CACHE_DIR, PROXY_CACHE_MAX_BYTES)
@@ -1,3 +1,5 @@
+import os
+import tempfile
 
 # Screen Settings
 SCREEN_SIZE = (1920, 1080)
@@ -9,11 +11,152 @@ COLOR_BACKGROUND = "#111827"
 COLOR_TEXT_WHITE = "#FFFFFF"
 COLOR_TEXT_BLACK = "#000000"
 
+# Encoding
+# Every segment of a render is encoded with the same settings so the pieces can be
+# joined without re-encoding. threads=0 lets x264 pick based on the core count.
+ENCODER_SETTINGS = {
+    'codec': 'libx264',
+    'preset': 'medium',
+    'crf': 23,
+    'threads': 0,
+    'pixel_format': 'yuv420p',
+    'tune': None,  # e.g. 'stillimage' for slideshows with few transitions
+    'keyint': None,  # Maximum frames between keyframes (None keeps the x264 default of 250)
+    'maxrate': None,  # Peak bitrate such as '4M' (buffer of twice that), for renditions with a bandwidth budget
+}
+# A bitrate cap only holds for a stream encoded in one go, so a video with a
+# maxrate is joined from uncapped segments of this quality and then encoded once more
+CAPPED_SEGMENT_CRF = 18
+ENCODER_BUFFERS = 2  # Frames that can be queued for ffmpeg while the next one renders
+# Processes that encode the timeline in parallel, each taking a run of whole
+# segments (1 encodes in the calling process). Worth it for long clips on many cores.
+ENCODE_SHARDS = 1
+STATIC_FRAME_COST = 0.1  # Encoding cost of a still frame relative to a composited one, for balancing shards
+
+# Render profiles: output size, frame rate and encoder settings (merged over
+# ENCODER_SETTINGS) chosen together per render
+RENDER_PROFILES = {
+    'draft': {
+        'size': (960, 540),
+        'fps': 24,
+        'encoder': {'preset': 'ultrafast', 'crf': 30, 'keyint': 240},
+    },
+    'standard': {
+        'size': SCREEN_SIZE,
+        'fps': FPS,
+        'encoder': {'preset': 'medium', 'crf': 23},
+    },
+    'archival': {
+        'size': SCREEN_SIZE,
+        'fps': 30,
+        'encoder': {'preset': 'slow', 'tune': 'stillimage', 'crf': 18, 'keyint': 60},
+    },
+}
+DEFAULT_RENDER_PROFILE = 'standard'
+
+# Renditions: extra outputs encoded from the frames of the same render (see src/renditions.py)
+RENDITION_POSTER_EXTENSIONS = ('.jpg', '.jpeg')
+RENDITION_POSTER_QUALITY = 90
+RENDITION_RESAMPLE = 'bilinear'  # Filter used to scale frames for renditions of another size
+RENDITION_PRESETS = {
+    'mobile': {'size': (1280, 720), 'fit': 'pad', 'encoder': {'crf': 25, 'maxrate': '3M'}},
+    'vertical': {'size': (1080, 1920), 'fit': 'crop', 'encoder': {'crf': 23}},
+    'square': {'size': (1080, 1080), 'fit': 'crop', 'encoder': {'crf': 23}},
+    'poster': {'size': None, 'fit': 'pad'},
+}
+
 # Defaults
 DEFAULT_SLIDE_DURATION = 3.0
 DEFAULT_TRANSITION_DURATION = 1.0
+QUICK_CLIP_TRANSITION_DURATION = 1.0  # Overlap between the slides of a Quick Clip
 MAX_UPLOAD_IMAGES = 100
 
+# Caching
+SLIDE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+SEGMENT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "clipmaker_segments")
+SEGMENT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+PREVIEW_CACHE_DIR = os.path.join(tempfile.gettempdir(), "clipmaker_previews")
+PREVIEW_CACHE_MAX_BYTES = 256 * 1024 * 1024
+AUDIO_CACHE_DIR = os.path.join(tempfile.gettempdir(), "clipmaker_audio")
+AUDIO_CACHE_MAX_BYTES = 512 * 1024 * 1024
+PROXY_CACHE_DIR = os.path.join(tempfile.gettempdir(), "clipmaker_proxies")
+PROXY_CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+# Per-job workspaces: uploads, the status file and the finished video live in a
+# directory under WORKSPACE_DIR; render intermediates go to WORKSPACE_SCRATCH_DIR,
+# which is on tmpfs when the host has /dev/shm. tmpfs can be small (64 MB in a
+# default Docker container), so a render only uses it when it has room for the
+# encoded segments, estimated at SCRATCH_BYTES_PER_PIXEL per pixel of every frame
+# (H.264 at the default quality averages about a fifth of that)
+WORKSPACE_DIR = os.path.join(tempfile.gettempdir(), "clipmaker_jobs")
+WORKSPACE_SCRATCH_DIR = os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "clipmaker_scratch")
+SCRATCH_BYTES_PER_PIXEL = 0.05
+WORKSPACE_MAX_BYTES = 4 * 1024 * 1024 * 1024  # Finished workspaces beyond this are deleted, least recently used first
+
+# Background render queue
+RENDER_QUEUE_WORKERS = 2  # Renders running at the same time, each in its own process
+RENDER_QUEUE_MAX_PENDING = 16  # Queued and running jobs before new submissions are refused
+RENDER_QUEUE_MAX_PER_OWNER = 2  # Unfinished jobs per browser session
+RENDER_QUEUE_POLL_INTERVAL = 1.0  # Seconds between status refreshes in the UI
+
+# Audio
+AUDIO_CODEC = 'aac'  # Codec of the muxed track; sources already in this codec are copied
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # Bytes copied at a time when spooling uploads to disk
+
+# Beat analysis (Quick Clip "cut on the beat"): the track is decoded in chunks
+# at BEAT_SAMPLE_RATE, its spectral flux is taken every BEAT_HOP_LENGTH samples
+# and beats are tracked at a tempo within BEAT_TEMPO_RANGE
+BEAT_SAMPLE_RATE = 22050
+BEAT_CHUNK_SECONDS = 10.0
+BEAT_WINDOW = 1024  # Samples per spectrum
+BEAT_HOP_LENGTH = 512  # Samples between spectra, ~23 ms
+BEAT_BANDS = 40  # Log-spaced frequency bands the flux is summed over, so a kick weighs as much as a hi-hat
+BEAT_TEMPO_RANGE = (60, 200)  # BPM
+BEAT_TEMPO_PRIOR = 120  # Most likely tempo (BPM) when several fit the onsets
+BEAT_TIGHTNESS = 100  # How strongly beats keep to the tempo; lower follows the onsets more
+
+# Transition preview
+PREVIEW_SIZE = (640, 360)
+PREVIEW_FPS = 24
+PREVIEW_FORMATS = ['mp4', 'webp', 'gif']
+PREVIEW_ENCODER_SETTINGS = {'preset': 'ultrafast', 'crf': 28}
+
+# Slide proxies: small cached images shown by the wizard instead of full-size frames
+PROXY_SIZES = {
+    'thumbnail': (320, 180),  # Storyboard strip
+    'preview': PREVIEW_SIZE,  # Static preview of the slide being edited
+}
+PROXY_FORMAT = 'webp'  # File extension, 'webp' or 'jpg'
+PROXY_QUALITY = 80
+STORYBOARD_THUMBNAIL_WIDTH = 160  # Display width of a storyboard thumbnail in pixels
+
+# Slide store shared with worker processes: 'mmap' (a file in SLIDE_STORE_DIR,
+# paged in by the OS) or 'shm' (multiprocessing.shared_memory, always resident)
+SLIDE_STORE_BACKING = 'mmap'
+SLIDE_STORE_DIR = tempfile.gettempdir()
+
+# Text overlays
+TEXT_FONT_PATHS = ['arial.ttf', 'Arial.ttf', 'DejaVuSans.ttf', 'LiberationSans-Regular.ttf']  # Tried in order, Pillow searches the system font folders
+TEXT_FONT_SIZE = 80  # Pixels at SCREEN_SIZE, scaled with the output height
+TEXT_SPRITE_CACHE_SIZE = 256  # Rendered text sprites kept per process
+
+# Ingestion
+INGEST_MAX_IN_FLIGHT = 8  # Full-resolution images decoded at the same time
+# Quick Clip images whose difference hashes differ in at most this many of 64 bits
+# are near-duplicates (burst shots, re-saved copies) and can be collapsed into one
+NEAR_DUPLICATE_DISTANCE = 10
+
+# Quality/speed tradeoff when decoding uploads.
+# draft_oversample: JPEGs are decoded at the smallest DCT scale that is still this many
+#   times larger than the final size (None decodes at full resolution).
+# resample: filter of the final resize to the target size.
+INGEST_QUALITY = 'balanced'
+INGEST_QUALITY_PROFILES = {
+    'best': {'draft_oversample': None, 'resample': 'lanczos'},
+    'balanced': {'draft_oversample': 1.0, 'resample': 'lanczos'},
+    'fast': {'draft_oversample': 1.0, 'resample': 'bilinear'},
+}
+
 # File Types
 IMAGE_EXTENSIONS = ['jpg', 'png', 'jpeg']
 AUDIO_EXTENSIONS = ['mp3', 'wav']
@@ -28,3 +171,19 @@ TRANSITIONS = [
     'zoom_in', 
     'spin_in'
 ]
+
+# Ken Burns motion: a slide can pan or zoom while it is shown. Its image is kept
+# at MOTION_SOURCE_SCALE times the frame size and every frame is a window of it
+# scaled to the frame (see src/motion.py). A window is (zoom, x, y): zoom 1 is
+# the whole image, x and y place a smaller window from 0 (left/top) to 1 (right/bottom).
+MOTION_ZOOM = 1.25  # Zoom of the tight end of a motion
+MOTION_SOURCE_SCALE = MOTION_ZOOM  # At the tightest window a source pixel still covers a frame pixel
+MOTION_RESAMPLE = 'bilinear'
+MOTIONS = {
+    'zoom_in': ((1.0, 0.5, 0.5), (MOTION_ZOOM, 0.5, 0.5)),
+    'zoom_out': ((MOTION_ZOOM, 0.5, 0.5), (1.0, 0.5, 0.5)),
+    'pan_left': ((MOTION_ZOOM, 1.0, 0.5), (MOTION_ZOOM, 0.0, 0.5)),
+    'pan_right': ((MOTION_ZOOM, 0.0, 0.5), (MOTION_ZOOM, 1.0, 0.5)),
+    'pan_up': ((MOTION_ZOOM, 0.5, 1.0), (MOTION_ZOOM, 0.5, 0.0)),
+    'pan_down': ((MOTION_ZOOM, 0.5, 0.0), (MOTION_ZOOM, 0.5, 1.0)),
+}
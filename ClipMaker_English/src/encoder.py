@@ -0,0 +1,236 @@
+import os
+import queue
+import subprocess
+import threading
+import numpy as np
+from PIL import Image
+from moviepy.config import FFMPEG_BINARY
+
+from src.constants import FPS, ENCODER_SETTINGS, ENCODER_BUFFERS, AUDIO_CODEC
+
+TRACK_TIMESCALE = 90000
+
+def bufsize(maxrate):
+    """Rate control buffer for a maxrate such as '4M' or 4000000: two seconds at the peak rate."""
+    text = str(maxrate)
+    if text[-1:].lower() in ('k', 'm'):
+        return f"{float(text[:-1]) * 2:g}{text[-1]}"
+    return str(int(float(text) * 2))
+
+def video_codec_args(fps=FPS, settings=None):
+    """
+    Returns the ffmpeg output arguments shared by all encoded segments.
+    settings overrides entries of ENCODER_SETTINGS.
+    """
+    settings = {**ENCODER_SETTINGS, **(settings or {})}
+    args = [
+        "-c:v", settings['codec'],
+        "-preset", settings['preset'],
+        "-crf", str(settings['crf']),
+        "-threads", str(settings['threads']),
+        "-pix_fmt", settings['pixel_format'],
+    ]
+    if settings.get('tune'):
+        args += ["-tune", settings['tune']]
+    if settings.get('keyint'):
+        args += ["-g", str(settings['keyint'])]
+    if settings.get('maxrate'):
+        args += ["-maxrate", str(settings['maxrate']), "-bufsize", bufsize(settings['maxrate'])]
+    return args + [
+        "-r", str(fps),
+        "-video_track_timescale", str(TRACK_TIMESCALE),
+        "-an",
+    ]
+
+def run_ffmpeg(args):
+    """Runs ffmpeg with the given arguments and raises on failure."""
+    cmd = [FFMPEG_BINARY, "-y", "-loglevel", "error"] + args
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode(errors='replace').strip()}")
+
+class FrameWriter:
+    """
+    Streams rgb24 frames into a long-lived ffmpeg process.
+    Frames are preallocated buffers handed out by acquire() and given back with
+    submit(); a background thread pipes them to ffmpeg so the next frame can be
+    rendered while the previous one is being written.
+    output_args replaces the output arguments built from settings and path,
+    e.g. to encode several outputs (see src/renditions.py).
+    """
+
+    def __init__(self, path, size, fps=FPS, settings=None, buffers=ENCODER_BUFFERS, output_args=None):
+        self.path = path
+        if output_args is None:
+            output_args = video_codec_args(fps, settings) + [path]
+        cmd = [
+            FFMPEG_BINARY, "-y", "-loglevel", "error",
+            "-f", "rawvideo",
+            "-pix_fmt", "rgb24",
+            "-s", f"{size[0]}x{size[1]}",
+            "-r", str(fps),
+            "-i", "-",
+        ] + output_args
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+        self.free = queue.Queue()
+        for _ in range(buffers):
+            self.free.put(np.empty((size[1], size[0], 3), dtype=np.uint8))
+        self.pending = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def _write_loop(self):
+        while True:
+            frame = self.pending.get()
+            if frame is None:
+                break
+            if self.error is None:
+                try:
+                    self.proc.stdin.write(frame.data)
+                except OSError as e:
+                    self.error = e
+            self.free.put(frame)
+
+    def acquire(self):
+        """Returns a free frame buffer, waiting while all of them are queued."""
+        if self.error is not None:
+            self.close()
+        return self.free.get()
+
+    def submit(self, frame):
+        """Queues a buffer returned by acquire() for encoding."""
+        self.pending.put(frame)
+
+    def write(self, frame):
+        """Copies an arbitrary frame into a buffer and queues it."""
+        buffer = self.acquire()
+        np.copyto(buffer, frame)
+        self.submit(buffer)
+
+    def close(self):
+        """Flushes the queued frames and waits for ffmpeg to finish."""
+        if self.thread.is_alive():
+            self.pending.put(None)
+            self.thread.join()
+        try:
+            self.proc.stdin.close()
+        except OSError as e:
+            self.error = self.error or e
+        error = self.proc.stderr.read()
+        self.proc.wait()
+        if self.proc.returncode != 0 or self.error is not None:
+            raise RuntimeError(f"ffmpeg failed: {error.decode(errors='replace').strip() or self.error}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.proc.kill()
+            self.pending.put(None)
+            self.thread.join()
+            try:
+                self.proc.stdin.close()
+            except OSError:
+                pass
+            self.proc.wait()
+
+class AnimationWriter:
+    """
+    Collects frames and saves them as an animated GIF or WebP with Pillow.
+    Has the same interface as FrameWriter.
+    """
+
+    def __init__(self, path, size, fps=FPS):
+        self.path = path
+        self.size = size
+        self.fps = fps
+        self.frames = []
+
+    def acquire(self):
+        return np.empty((self.size[1], self.size[0], 3), dtype=np.uint8)
+
+    def submit(self, frame):
+        self.frames.append(Image.fromarray(frame))
+
+    def write(self, frame):
+        self.frames.append(Image.fromarray(frame))
+
+    def close(self):
+        if not self.frames:
+            raise ValueError("No frames to save")
+        self.frames[0].save(
+            self.path,
+            save_all=True,
+            append_images=self.frames[1:],
+            duration=round(1000 / self.fps),
+            loop=0,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+
+def encode_still(frame, num_frames, path, fps=FPS, settings=None, output_args=None):
+    """
+    Encodes a single frame held for num_frames frames.
+    The still is handed to ffmpeg once instead of piping the same frame repeatedly.
+    output_args replaces the output arguments, as for FrameWriter; they must
+    limit every output to num_frames.
+    """
+    still_path = os.path.splitext(path)[0] + ".ppm"
+    Image.fromarray(frame).save(still_path)
+    if output_args is None:
+        output_args = ["-frames:v", str(num_frames)] + video_codec_args(fps, settings) + [path]
+    try:
+        run_ffmpeg([
+            "-loop", "1",
+            "-framerate", str(fps),
+            "-i", still_path,
+        ] + output_args)
+    finally:
+        os.remove(still_path)
+
+def reencode_video(input_path, output_path, fps=FPS, settings=None):
+    """
+    Encodes a whole video again in one pass, e.g. so a bitrate cap (maxrate) holds
+    across the joins of segments that were encoded on their own.
+    """
+    run_ffmpeg(["-i", input_path] + video_codec_args(fps, settings) + [output_path])
+
+def concat_videos(paths, output_path):
+    """
+    Joins encoded segments with the concat demuxer, copying the streams.
+    """
+    list_path = output_path + ".txt"
+    with open(list_path, "w") as f:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    try:
+        run_ffmpeg(["-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", output_path])
+    finally:
+        os.remove(list_path)
+
+def mux_audio(video_path, audio_path, output_path, duration, audio_codec=AUDIO_CODEC):
+    """
+    Adds an audio track to a video without re-encoding the video stream.
+    audio_codec 'copy' also keeps the audio stream as it is.
+    """
+    run_ffmpeg([
+        "-i", video_path,
+        "-i", audio_path,
+        "-map", "0:v:0",
+        "-map", "1:a:0",
+        "-c:v", "copy",
+        "-c:a", audio_codec,
+        "-t", f"{duration:.3f}",
+        output_path,
+    ])
@@ -0,0 +1,136 @@
+import hashlib
+import io
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from PIL import Image, ImageOps
+import numpy as np
+
+from src.constants import SCREEN_SIZE, INGEST_MAX_IN_FLIGHT, NEAR_DUPLICATE_DISTANCE
+from src.utils import resize_and_pad_image
+
+def load_image_array(image_file, target_size=SCREEN_SIZE):
+    """
+    Decodes an uploaded image and returns it resized and padded as a numpy array.
+    """
+    if hasattr(image_file, 'seek'):
+        image_file.seek(0)
+    with Image.open(image_file) as img:
+        return np.array(resize_and_pad_image(img, target_size))
+
+def load_in_order(loads, max_in_flight=INGEST_MAX_IN_FLIGHT, progress_callback=None):
+    """
+    Calls the functions in loads (e.g. the load of lazy layers) in threads and
+    yields their results in input order. Pillow releases the GIL while decoding
+    and resampling, so threads scale across cores. At most max_in_flight results
+    are being loaded or waiting to be taken at once, which bounds the number of
+    images held in memory; the next one starts as soon as one is taken.
+    """
+    loads = list(loads)
+    total = len(loads)
+    workers = max(1, min(max_in_flight, os.cpu_count() or 1, total))
+    upcoming = iter(loads)
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for load in islice(upcoming, max_in_flight):
+            pending.append(executor.submit(load))
+        done = 0
+        while pending:
+            result = pending.popleft().result()
+            for load in islice(upcoming, 1):
+                pending.append(executor.submit(load))
+            done += 1
+            if progress_callback:
+                progress_callback(done, total)
+            yield result
+
+def load_images(image_files, target_size=SCREEN_SIZE, max_in_flight=INGEST_MAX_IN_FLIGHT, progress_callback=None):
+    """
+    Decodes and resizes images concurrently and returns the arrays in input order
+    (see load_in_order).
+    """
+    return list(load_in_order([partial(load_image_array, image_file, target_size) for image_file in image_files],
+                              max_in_flight, progress_callback))
+
+def read_upload(image_file):
+    """Returns the bytes of a path or a file-like object (e.g. UploadedFile)."""
+    if isinstance(image_file, str):
+        with open(image_file, "rb") as f:
+            return f.read()
+    if hasattr(image_file, 'getvalue'):
+        return image_file.getvalue()
+    image_file.seek(0)
+    data = image_file.read()
+    image_file.seek(0)
+    return data
+
+def difference_hash(image):
+    """
+    64-bit difference hash of an image: whether each of 8x8 cells of a grayscale
+    thumbnail is brighter than its right neighbour. Resized or re-encoded copies
+    and shots of a burst differ in a few bits at most.
+    """
+    pixels = np.asarray(image.convert('L').resize((9, 8), Image.Resampling.BOX), dtype=np.int16)
+    return int.from_bytes(np.packbits(pixels[:, 1:] > pixels[:, :-1]).tobytes(), "big")
+
+def fingerprint_image(image_file, perceptual=True):
+    """
+    Reads an image once and returns {'content', 'dhash'}: the hash of its bytes
+    (the same digest as cache.hash_content) and its difference_hash, taken from
+    a reduced decode. dhash is None without perceptual, which skips decoding
+    altogether, or if the image cannot be decoded; loading it reports the error later.
+    """
+    data = read_upload(image_file)
+    content = hashlib.blake2b(data, digest_size=16).hexdigest()
+    if not perceptual:
+        return {'content': content, 'dhash': None}
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.draft('L', (64, 64))
+            dhash = difference_hash(ImageOps.exif_transpose(img))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        dhash = None
+    return {'content': content, 'dhash': dhash}
+
+def fingerprint_images(image_files, max_in_flight=INGEST_MAX_IN_FLIGHT, perceptual=True):
+    """
+    Fingerprints images concurrently and returns the fingerprints in input order.
+    Without perceptual only the bytes are hashed (see fingerprint_image).
+    """
+    workers = max(1, min(max_in_flight, os.cpu_count() or 1, len(image_files)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(partial(fingerprint_image, perceptual=perceptual), image_files))
+
+def find_duplicates(fingerprints, max_distance=0):
+    """
+    Returns, for every image, the index of the first image it duplicates, or its
+    own index. Images duplicate each other when their bytes are equal or, with
+    max_distance > 0, when their difference hashes differ in at most that many bits.
+    """
+    owners = []
+    by_content = {}
+    originals = []
+    for i, fingerprint in enumerate(fingerprints):
+        owner = by_content.get(fingerprint['content'])
+        if owner is None and max_distance and fingerprint['dhash'] is not None:
+            owner = next((j for j in originals if fingerprints[j]['dhash'] is not None
+                          and bin(fingerprint['dhash'] ^ fingerprints[j]['dhash']).count("1") <= max_distance), None)
+        if owner is None:
+            owner = i
+            originals.append(i)
+        by_content.setdefault(fingerprint['content'], owner)
+        owners.append(owner)
+    return owners
+
+def drop_duplicates(image_files, fingerprints, max_distance=NEAR_DUPLICATE_DISTANCE):
+    """
+    Drops the images that duplicate an earlier one (see find_duplicates), e.g.
+    the rest of a burst or a photo uploaded twice. Returns the remaining images
+    and their fingerprints.
+    """
+    owners = find_duplicates(fingerprints, max_distance)
+    keep = [i for i, owner in enumerate(owners) if owner == i]
+    return [image_files[i] for i in keep], [fingerprints[i] for i in keep]
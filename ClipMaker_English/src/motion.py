@@ -0,0 +1,55 @@
+import numpy as np
+from PIL import Image
+
+from src.constants import MOTIONS, MOTION_SOURCE_SCALE, MOTION_RESAMPLE
+
+# Ken Burns pan and zoom. A slide with a motion is loaded once, larger than the
+# frame (motion_source_size), and every frame shows a window of it scaled to the
+# frame size. The windows of a run of frames are worked out up front as a table
+# of crop boxes, so drawing a frame is a single crop-resize of the same source.
+
+def motion_source_size(size, scale=MOTION_SOURCE_SCALE):
+    """(width, height) at which the image of a slide with a motion is loaded for frames of size."""
+    return (round(size[0] * scale), round(size[1] * scale))
+
+def crop_boxes(motion, times, duration, source_size):
+    """
+    Table of the windows of a motion (a MOTIONS name) at times, in seconds since
+    the slide started: one (left, top, right, bottom) row of source pixels per
+    time. The slide moves evenly from the first window of the motion at its start
+    to the second at its end (duration); zoom changes at a constant rate.
+    """
+    (start_zoom, start_x, start_y), (end_zoom, end_x, end_y) = MOTIONS[motion]
+    progress = np.clip(np.asarray(times, dtype=np.float64) / duration, 0.0, 1.0) if duration > 0 else np.ones(len(times))
+    zoom = start_zoom * (end_zoom / start_zoom) ** progress
+    x = start_x + (end_x - start_x) * progress
+    y = start_y + (end_y - start_y) * progress
+    width = source_size[0] / zoom
+    height = source_size[1] / zoom
+    left = x * (source_size[0] - width)
+    top = y * (source_size[1] - height)
+    return np.stack([left, top, left + width, top + height], axis=1)
+
+class MotionKernel:
+    """
+    Draws the frames of a slide in motion: frame k is boxes[k] (see crop_boxes)
+    of the source image scaled to size.
+    """
+
+    def __init__(self, source, boxes, size):
+        self.source = Image.fromarray(np.ascontiguousarray(source))
+        self.boxes = [tuple(box) for box in boxes.tolist()]
+        self.size = tuple(size)
+        self.resample = Image.Resampling[MOTION_RESAMPLE.upper()]
+        self.buffer = None
+
+    def render(self, k, out):
+        """Writes frame k into out and returns it."""
+        out[...] = self.source.resize(self.size, self.resample, box=self.boxes[k])
+        return out
+
+    def frame(self, k):
+        """Frame k in a buffer owned by the kernel, which the next call overwrites."""
+        if self.buffer is None:
+            self.buffer = np.empty((self.size[1], self.size[0], 3), dtype=np.uint8)
+        return self.render(k, self.buffer)
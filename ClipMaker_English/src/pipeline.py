@@ -0,0 +1,166 @@
+import random
+import tempfile
+from functools import partial
+
+from src.constants import TRANSITIONS, INGEST_QUALITY, ENCODE_SHARDS, RENDER_PROFILES, DEFAULT_RENDER_PROFILE
+from src.utils import create_slide_image
+from src.renderer import make_lazy_layer, render_renditions
+from src.renditions import make_rendition
+from src.motion import motion_source_size
+from src.plan import quick_clip_plan, beat_clip_plan, custom_clip_plan
+from src.ingest import load_image_array, fingerprint_images, drop_duplicates
+from src.cache import segment_cache, slide_cache_key
+from src.profiling import RenderProfiler
+from src.audio import prepare_audio
+from src.beats import analyze_beats
+
+# Render pipelines without any UI dependency. The Streamlit pages and the batch
+# CLI both call these, receive progress through a ProgressReporter and can pass
+# a RenderProfiler to get the time spent in each stage.
+
+class ProgressReporter:
+    """
+    Receives progress from a render. The base class ignores everything;
+    front ends override the methods they can display.
+    """
+
+    def status(self, message):
+        """A short description of the current step."""
+
+    def progress(self, fraction):
+        """Overall progress between 0 and 1 while preparing the slides."""
+
+    def encoding(self, fraction):
+        """Progress of the final render between 0 and 1; called with 0 when it starts."""
+
+def resolve_render_profile(profile=DEFAULT_RENDER_PROFILE, encoder_settings=None):
+    """
+    Returns the size, fps and encoder settings of a named entry of RENDER_PROFILES,
+    with encoder_settings applied on top. Raises ValueError for unknown names.
+    """
+    if profile not in RENDER_PROFILES:
+        raise ValueError(f"Unknown render profile {profile!r}; choose one of {', '.join(RENDER_PROFILES)}")
+    settings = RENDER_PROFILES[profile]
+    return {
+        'size': tuple(settings['size']),
+        'fps': settings['fps'],
+        'encoder': {**settings['encoder'], **(encoder_settings or {})},
+    }
+
+def render_quick_clip(image_files, audio_path, output_path, reporter=None, rng=random, encoder_settings=None, profiler=None, shards=ENCODE_SHARDS, profile=DEFAULT_RENDER_PROFILE, scratch_dir=None, renditions=None, collapse_duplicates=False, sync_to_beats=False):
+    """
+    Renders a Quick Clip: the images share the audio duration evenly, each one
+    entering with a random transition. image_files are paths or file-like objects.
+    Images are decoded during the render, when their slide comes up; an image
+    uploaded more than once is decoded once for all its slides.
+    collapse_duplicates drops images that are near-duplicates of an earlier one,
+    such as the rest of a burst (see ingest.drop_duplicates).
+    sync_to_beats starts the slides and ends their transitions on beats of the
+    audio (see beats.analyze_beats and plan.beat_clip_plan).
+    profile names an entry of RENDER_PROFILES; encoder_settings override its encoder settings.
+    Intermediate files are written inside scratch_dir when given.
+    renditions (see src/renditions.py) are extra outputs encoded from the same frames.
+    """
+    reporter = reporter or ProgressReporter()
+    profiler = profiler or RenderProfiler()
+    render_settings = resolve_render_profile(profile, encoder_settings)
+    render_settings['scratch_dir'] = scratch_dir
+    render_settings['renditions'] = list(renditions or [])
+    with profiler.session(), tempfile.TemporaryDirectory(prefix="clipmaker_", dir=scratch_dir) as audio_dir:
+        render_settings['audio_dir'] = audio_dir
+        return quick_clip_steps(image_files, audio_path, output_path, reporter, rng, render_settings, profiler, shards,
+                                collapse_duplicates, sync_to_beats)
+
+def quick_clip_steps(image_files, audio_path, output_path, reporter, rng, render_settings, profiler, shards, collapse_duplicates=False, sync_to_beats=False):
+    """The body of render_quick_clip, run inside the profiler session."""
+    reporter.status("Processing audio...")
+    with profiler.stage('audio prepare'):
+        audio_track, audio_duration = prepare_audio(audio_path, render_settings['audio_dir'])
+
+    reporter.status("Checking images...")
+    with profiler.stage('image fingerprint', frames=len(image_files)):
+        # The difference hashes (a decode per image) are only needed to spot near-duplicates
+        fingerprints = fingerprint_images(image_files, perceptual=collapse_duplicates)
+    if collapse_duplicates:
+        image_files, fingerprints = drop_duplicates(image_files, fingerprints)
+
+    num_images = len(image_files)
+    transitions = [rng.choice(TRANSITIONS) if i > 0 else None for i in range(num_images)]
+    if sync_to_beats:
+        reporter.status("Finding the beat...")
+        with profiler.stage('beat analysis'):
+            beats = analyze_beats(audio_path)['beats']
+        plan = beat_clip_plan(num_images, audio_duration, transitions, beats, render_settings['fps'])
+    else:
+        plan = quick_clip_plan(num_images, audio_duration, transitions, render_settings['fps'])
+
+    layers = []
+    size = render_settings['size']
+    reporter.status("Processing images...")
+
+    for i, (image_file, fingerprint) in enumerate(zip(image_files, fingerprints)):
+        key = {'source': fingerprint['content'], 'size': size, 'quality': INGEST_QUALITY}
+        layers.append(make_lazy_layer(partial(load_image_array, image_file, size), key, *plan.layers[i], size=size))
+        reporter.progress((i + 1) / num_images * 0.1)
+
+    reporter.status("Composing video...")
+    reporter.encoding(0.0)
+    render_renditions(layers, plan, [make_rendition(output_path)] + render_settings['renditions'],
+                      audio_path=audio_track, progress_callback=reporter.encoding,
+                      encoder_settings=render_settings['encoder'],
+                      segment_cache=segment_cache, profiler=profiler, shards=shards, audio_codec="copy",
+                      scratch_dir=render_settings['scratch_dir'])
+    return output_path
+
+def render_custom_clip(slides, audio_path, output_path, reporter=None, encoder_settings=None, profiler=None, shards=ENCODE_SHARDS, profile=DEFAULT_RENDER_PROFILE, scratch_dir=None, renditions=None):
+    """
+    Renders a Custom Clip from the wizard's slide dictionaries. A slide's 'motion'
+    (a MOTIONS name, optional) pans or zooms it while it is shown.
+    audio_path is optional; when the audio is longer than the slides the last slide is extended.
+    Slide images are built during the render, when their slide comes up.
+    profile names an entry of RENDER_PROFILES; encoder_settings override its encoder settings.
+    Intermediate files are written inside scratch_dir when given.
+    renditions (see src/renditions.py) are extra outputs encoded from the same frames.
+    """
+    reporter = reporter or ProgressReporter()
+    profiler = profiler or RenderProfiler()
+    render_settings = resolve_render_profile(profile, encoder_settings)
+    render_settings['scratch_dir'] = scratch_dir
+    render_settings['renditions'] = list(renditions or [])
+    with profiler.session(), tempfile.TemporaryDirectory(prefix="clipmaker_", dir=scratch_dir) as audio_dir:
+        render_settings['audio_dir'] = audio_dir
+        return custom_clip_steps(slides, audio_path, output_path, reporter, render_settings, profiler, shards)
+
+def custom_clip_steps(slides, audio_path, output_path, reporter, render_settings, profiler, shards):
+    """The body of render_custom_clip, run inside the profiler session."""
+    reporter.status("Preparing resources...")
+
+    audio_track, audio_duration = None, None
+    if audio_path:
+        with profiler.stage('audio prepare'):
+            audio_track, audio_duration = prepare_audio(audio_path, render_settings['audio_dir'])
+
+    plan = custom_clip_plan(slides, audio_duration, render_settings['fps'])
+    layers = []
+    size = render_settings['size']
+    total_slides = len(slides)
+
+    for i, slide in enumerate(slides):
+        reporter.status(f"Processing slide {i+1}/{total_slides}...")
+
+        # A slide with a motion is built larger than the frame, see src/motion.py
+        image_size = motion_source_size(size) if plan.layers[i].motion else size
+        with profiler.stage('image hash', frames=1):
+            key = slide_cache_key(slide, image_size)
+        layers.append(make_lazy_layer(partial(create_slide_image, slide, image_size, cache=False), key,
+                                      *plan.layers[i], size=size))
+        reporter.progress((i + 1) / total_slides * 0.5)
+
+    reporter.status("Composing video...")
+    reporter.encoding(0.0)
+    render_renditions(layers, plan, [make_rendition(output_path)] + render_settings['renditions'],
+                      audio_path=audio_track, progress_callback=reporter.encoding,
+                      encoder_settings=render_settings['encoder'],
+                      segment_cache=segment_cache, profiler=profiler, shards=shards, audio_codec="copy",
+                      scratch_dir=render_settings['scratch_dir'])
+    return output_path
@@ -0,0 +1,187 @@
+import math
+from collections import namedtuple
+
+from src.constants import FPS, QUICK_CLIP_TRANSITION_DURATION
+
+# A render plan is the timeline worked out once, before anything is decoded or
+# encoded: the timing of every slide and the runs of frames ("segments") that
+# show the same layers. It is built from tuples, so it is cheap to compile,
+# cannot be changed by the code that renders it and pickles to worker processes
+# in a few bytes. Images are not part of the plan: layer i of the plan is drawn
+# with layer i of the renderer's layer list.
+
+# Timing of one slide. The transition is applied when the slide enters, over the
+# layers below it. motion is a MOTIONS name (pan or zoom over the whole duration) or None.
+PlanLayer = namedtuple('PlanLayer', 'start duration transition transition_duration motion', defaults=(None,))
+
+# Frames [start_frame, end_frame) showing the same layers, bottom first. A static
+# segment shows one still layer (or none: black), a motion segment one layer in
+# motion; a transition composites several.
+# offsets holds, per layer, the time of start_frame relative to the layer's start.
+PlanSegment = namedtuple('PlanSegment', 'kind layers start_frame end_frame offsets')
+
+RenderPlan = namedtuple('RenderPlan', 'layers segments fps duration total_frames')
+
+def plan_layer(start, duration, transition=None, transition_duration=0.0, motion=None):
+    """Timing of one slide; a slide without a transition has a transition_duration of 0."""
+    return PlanLayer(float(start), float(duration), transition, float(transition_duration) if transition else 0.0,
+                     motion or None)
+
+def layer_timing(layer):
+    """The PlanLayer of a layer dictionary from renderer.make_layer."""
+    return plan_layer(layer['start'], layer['duration'], layer['transition'], layer['transition_duration'],
+                      layer.get('motion'))
+
+def visible_layers(layers, t):
+    """
+    Returns the indices of the layers that contribute to the frame at time t,
+    bottom first. Layers below a slide whose transition has finished are hidden
+    because every slide covers the whole screen.
+    """
+    stack = []
+    for i in range(len(layers) - 1, -1, -1):
+        layer = layers[i]
+        if not (layer.start <= t < layer.start + layer.duration):
+            continue
+        stack.append(i)
+        if t - layer.start >= layer.transition_duration:
+            break
+    stack.reverse()
+    return stack
+
+def first_frame(reached, estimate):
+    """
+    Index of the first frame for which reached(frame) is true, starting from an
+    estimate. reached must be false before some frame and true from there on.
+    Stepping from the estimate keeps the float comparisons identical to visible_layers.
+    """
+    frame = max(0, estimate)
+    while frame > 0 and reached(frame - 1):
+        frame -= 1
+    while not reached(frame):
+        frame += 1
+    return frame
+
+def compile_plan(layers, duration, fps=FPS):
+    """
+    Compiles slide timings (PlanLayer tuples or make_layer dictionaries) into the
+    RenderPlan of a timeline of duration seconds. The visible layers only change
+    where a slide starts, ends or finishes its transition, so they are worked out
+    once per change instead of once per frame.
+    """
+    layers = tuple(layer if isinstance(layer, PlanLayer) else layer_timing(layer) for layer in layers)
+    total_frames = int(duration * fps)
+
+    cuts = {0, total_frames}
+    for layer in layers:
+        end = layer.start + layer.duration
+        cuts.add(first_frame(lambda f: f / fps >= layer.start, math.ceil(layer.start * fps)))
+        cuts.add(first_frame(lambda f: f / fps - layer.start >= layer.transition_duration,
+                             math.ceil((layer.start + layer.transition_duration) * fps)))
+        cuts.add(first_frame(lambda f: f / fps >= end, math.ceil(end * fps)))
+    cuts = sorted(cut for cut in cuts if cut <= total_frames)
+
+    segments = []
+    for start_frame, end_frame in zip(cuts, cuts[1:]):
+        stack = tuple(visible_layers(layers, start_frame / fps))
+        if len(stack) > 1:
+            kind = 'transition'
+        else:
+            kind = 'motion' if stack and layers[stack[0]].motion else 'static'
+        if segments and segments[-1].kind == kind and segments[-1].layers == stack:
+            segments[-1] = segments[-1]._replace(end_frame=end_frame)
+        else:
+            offsets = tuple(round(start_frame / fps - layers[i].start, 6) for i in stack)
+            segments.append(PlanSegment(kind, stack, start_frame, end_frame, offsets))
+    return RenderPlan(layers, tuple(segments), fps, duration, total_frames)
+
+def quick_clip_plan(count, audio_duration, transitions, fps=FPS, transition_duration=QUICK_CLIP_TRANSITION_DURATION):
+    """
+    Plan of a Quick Clip: count slides share the audio duration evenly, each
+    overlapping the previous one by transition_duration. transitions[i] is the
+    transition of slide i; the first slide has none.
+    """
+    if count > 1:
+        duration_per_image = (audio_duration + transition_duration * (count - 1)) / count
+    else:
+        duration_per_image = audio_duration
+        transition_duration = 0
+
+    layers = [plan_layer(i * (duration_per_image - transition_duration), duration_per_image,
+                         transitions[i] if i > 0 else None, transition_duration)
+              for i in range(count)]
+    return compile_plan(layers, audio_duration, fps)
+
+def beat_clip_plan(count, audio_duration, transitions, beats, fps=FPS, transition_duration=QUICK_CLIP_TRANSITION_DURATION):
+    """
+    Plan of a Quick Clip cut on the beat: like quick_clip_plan, but every slide
+    after the first starts on the beat nearest its even start, and its transition
+    ends on the beat nearest transition_duration later. A slide only takes a beat
+    within half a slide of its even start, so the slides keep about the same
+    length. Without a fitting beat the even timing is kept.
+    """
+    even = quick_clip_plan(count, audio_duration, transitions, fps, transition_duration)
+    if count < 2 or not beats:
+        return even
+
+    step = even.layers[1].start
+    transition_duration = even.layers[1].transition_duration
+    beats = sorted(beats)
+    starts = [0.0]
+    durations = [0.0]
+    for i in range(1, count):
+        target = even.layers[i].start
+        lower = max(target - step / 2, starts[-1] + durations[-1])
+        upper = min(target + step / 2 - transition_duration, audio_duration - transition_duration)
+        if lower > upper:
+            return even
+        start = min((b for b in beats if lower <= b <= upper), key=lambda b: abs(b - target), default=target)
+        start = min(max(start, lower), upper)
+
+        # Up to the start of the next slide's beats, or the end of the audio
+        limit = target + step / 2 if i < count - 1 else audio_duration
+        ends = [b for b in beats if start + transition_duration / 2 <= b <= min(start + 2 * transition_duration, limit)]
+        end = min(ends, key=lambda b: abs(b - start - transition_duration), default=start + transition_duration)
+        starts.append(start)
+        durations.append(end - start)
+
+    layers = []
+    for i in range(count):
+        end = starts[i + 1] + durations[i + 1] if i < count - 1 else audio_duration
+        layers.append(plan_layer(starts[i], end - starts[i], transitions[i] if i > 0 else None, durations[i]))
+    return compile_plan(layers, audio_duration, fps)
+
+def custom_clip_plan(slides, audio_duration=None, fps=FPS):
+    """
+    Plan of a Custom Clip from the wizard's slide dictionaries. Each slide starts
+    when the next one's transition has to begin; when the audio is longer than
+    the slides the last slide is extended (a shorter audio is cut by the mux).
+    """
+    layers = []
+    current_start_time = 0.0
+    for i, slide in enumerate(slides):
+        duration = float(slide['duration'])
+        layers.append(plan_layer(current_start_time, duration, slide['transition'] if i > 0 else None,
+                                 float(slide['transition_duration']), slide.get('motion')))
+        if i < len(slides) - 1:
+            current_start_time += duration - float(slides[i + 1]['transition_duration'])
+        else:
+            current_start_time += duration
+
+    video_duration = layers[-1].start + layers[-1].duration if layers else 0.0
+    if audio_duration and audio_duration > video_duration:
+        layers[-1] = layers[-1]._replace(duration=layers[-1].duration + audio_duration - video_duration)
+        video_duration = audio_duration
+    return compile_plan(layers, video_duration, fps)
+
+def preview_plan(transition, transition_duration, fps=FPS):
+    """
+    Plan of a transition preview: the previous slide alone for half the transition
+    duration, the transition, then the new slide for another half.
+    """
+    offset = 0.5 * transition_duration
+    layers = [
+        plan_layer(0, offset + transition_duration),
+        plan_layer(offset, offset + transition_duration, transition, transition_duration),
+    ]
+    return compile_plan(layers, transition_duration * 2.0, fps)
@@ -0,0 +1,166 @@
+import cProfile
+import io
+import pstats
+import sys
+import time
+from contextlib import contextmanager
+
+# Per-stage timing for renders. The pipelines wrap their steps in
+# profiler.stage(...) and report per-frame composite times with profiler.frame(...);
+# report() turns the measurements into a JSON-friendly dictionary.
+
+def peak_rss_mb():
+    """Peak resident set size of the current process in MB, or None if unavailable."""
+    # VmHWM is reset on exec, unlike ru_maxrss which a spawned child inherits from its parent
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+class RenderProfiler:
+    """
+    Records wall and CPU time per render stage. Stage times are self times: a
+    stage nested in another, or frames reported with frame(), are not counted
+    again in the enclosing stage.
+    CPU time is that of this process; the ffmpeg encoder runs in a child process
+    and only shows up as wall time. With cprofile=True the session is also run
+    under cProfile (main thread only) and the top functions are added to the report;
+    cprofile_path additionally saves the raw stats for tools such as snakeviz.
+    """
+
+    def __init__(self, cprofile=False, cprofile_path=None, top_functions=25):
+        self.stages = {}
+        self.order = []
+        self.stack = []
+        self.total_wall = 0.0
+        self.total_cpu = 0.0
+        self.cprofile = cprofile or bool(cprofile_path)
+        self.cprofile_path = cprofile_path
+        self.top_functions = top_functions
+        self.profile_text = None
+
+    def entry(self, name):
+        if name not in self.stages:
+            self.stages[name] = {'wall': 0.0, 'cpu': 0.0, 'calls': 0, 'frames': 0, 'latencies': [], 'peak_rss_mb': None}
+            self.order.append(name)
+        return self.stages[name]
+
+    def add(self, name, wall, cpu, frames=0):
+        entry = self.entry(name)
+        entry['wall'] += wall
+        entry['cpu'] += cpu
+        entry['frames'] += frames
+        # Remove the time from the enclosing stage so every second is counted once
+        if self.stack:
+            self.stack[-1]['child_wall'] += wall
+            self.stack[-1]['child_cpu'] += cpu
+
+    @contextmanager
+    def stage(self, name, frames=0):
+        """Times the enclosed block as one call of the named stage."""
+        frame = {'child_wall': 0.0, 'child_cpu': 0.0}
+        self.stack.append(frame)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            self.stack.pop()
+            self.add(name, wall - frame['child_wall'], cpu - frame['child_cpu'], frames)
+            entry = self.stages[name]
+            entry['calls'] += 1
+            entry['peak_rss_mb'] = peak_rss_mb()
+
+    def merge(self, stages, prefix=''):
+        """
+        Adds the stages of a profiler that ran elsewhere, e.g. in a worker process.
+        Their times overlap with this process, so they are kept under their own names.
+        """
+        for name, other in stages.items():
+            entry = self.entry(prefix + name)
+            for field in ('wall', 'cpu', 'calls', 'frames'):
+                entry[field] += other[field]
+            entry['latencies'].extend(other['latencies'])
+            if other['peak_rss_mb'] and (entry['peak_rss_mb'] or 0) < other['peak_rss_mb']:
+                entry['peak_rss_mb'] = other['peak_rss_mb']
+
+    def frame(self, name, wall, cpu=0.0):
+        """Records one frame of the named stage that took wall seconds."""
+        self.add(name, wall, cpu, frames=1)
+        self.stages[name]['latencies'].append(wall)
+
+    @contextmanager
+    def session(self):
+        """Wraps a whole render: measures the totals and runs cProfile when enabled."""
+        profile = cProfile.Profile() if self.cprofile else None
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        if profile:
+            profile.enable()
+        try:
+            yield self
+        finally:
+            if profile:
+                profile.disable()
+            self.total_wall += time.perf_counter() - wall_start
+            self.total_cpu += time.process_time() - cpu_start
+            if profile:
+                if self.cprofile_path:
+                    profile.dump_stats(self.cprofile_path)
+                output = io.StringIO()
+                pstats.Stats(profile, stream=output).sort_stats("cumulative").print_stats(self.top_functions)
+                self.profile_text = output.getvalue()
+
+    def report(self):
+        """Returns the measurements as a dictionary that can be dumped to JSON."""
+        stages = []
+        for name in self.order:
+            entry = self.stages[name]
+            stage = {
+                'stage': name,
+                'wall': round(entry['wall'], 4),
+                'cpu': round(entry['cpu'], 4),
+                'calls': entry['calls'] or len(entry['latencies']),
+                'frames': entry['frames'],
+                'fps': round(entry['frames'] / entry['wall'], 1) if entry['frames'] and entry['wall'] > 0 else None,
+                'peak_rss_mb': round(entry['peak_rss_mb'], 1) if entry['peak_rss_mb'] else None,
+            }
+            latencies = sorted(entry['latencies'])
+            if latencies:
+                stage['latency_ms'] = {
+                    'p50': round(percentile(latencies, 0.50) * 1000, 2),
+                    'p90': round(percentile(latencies, 0.90) * 1000, 2),
+                    'p99': round(percentile(latencies, 0.99) * 1000, 2),
+                    'max': round(latencies[-1] * 1000, 2),
+                }
+            stages.append(stage)
+
+        peak = peak_rss_mb()
+        report = {
+            'wall': round(self.total_wall, 4),
+            'cpu': round(self.total_cpu, 4),
+            'peak_rss_mb': round(peak, 1) if peak else None,
+            'stages': stages,
+        }
+        if self.profile_text:
+            report['cprofile'] = self.profile_text
+        if self.cprofile_path:
+            report['cprofile_path'] = self.cprofile_path
+        return report
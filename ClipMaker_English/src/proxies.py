@@ -0,0 +1,47 @@
+from PIL import Image
+
+from src.constants import PROXY_SIZES, PROXY_FORMAT, PROXY_QUALITY
+from src.cache import proxy_cache, slide_cache_key, hash_key
+from src.utils import create_slide_image
+
+# The wizard never shows full-size frames: the storyboard strip and the static
+# preview use small image files ("proxies") built from the slide at the proxy
+# size, so a rerun sends a few kilobytes per slide instead of a raw 1080p frame.
+# Full-size frames are only built by the render.
+
+def proxy_name(slide_data, kind='thumbnail'):
+    """Cache file name of a slide's proxy of the given kind (see PROXY_SIZES)."""
+    key = slide_cache_key(slide_data, PROXY_SIZES[kind])
+    return hash_key([list(key), PROXY_QUALITY]) + f".{PROXY_FORMAT}"
+
+def save_proxy(slide_data, size, path):
+    """
+    Builds a slide at size and saves it to path, in the format of its extension.
+    The slide cache keeps the picture at proxy size, so a text edit does not
+    decode the image again.
+    """
+    frame = create_slide_image(slide_data, size)
+    Image.fromarray(frame).save(path, quality=PROXY_QUALITY)
+
+def slide_proxy(slide_data, kind='thumbnail'):
+    """
+    Returns the path of a slide's proxy, building it if it is not cached.
+    Saved slides carry their proxy names (see make_proxies), so their uploads
+    are not hashed again.
+    """
+    name = (slide_data.get('proxies') or {}).get(kind) or proxy_name(slide_data, kind)
+    path = proxy_cache.lookup(name)
+    if path is None:
+        path = proxy_cache.store(name, lambda tmp_path: save_proxy(slide_data, PROXY_SIZES[kind], tmp_path))
+        proxy_cache.trim()
+    return path
+
+def make_proxies(slide_data):
+    """
+    Builds every proxy of a slide that is being saved and records their names
+    in it under 'proxies'. Returns the slide.
+    """
+    slide_data['proxies'] = {kind: proxy_name(slide_data, kind) for kind in PROXY_SIZES}
+    for kind in PROXY_SIZES:
+        slide_proxy(slide_data, kind)
+    return slide_data
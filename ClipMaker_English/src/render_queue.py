@@ -0,0 +1,260 @@
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from src.constants import (
+    RENDER_QUEUE_WORKERS, RENDER_QUEUE_MAX_PENDING, RENDER_QUEUE_MAX_PER_OWNER, ENCODE_SHARDS,
+)
+from src.pipeline import ProgressReporter
+from src.batch import run_job
+from src.workspace import workspaces as default_workspaces
+
+# Renders run in a bounded pool of worker processes instead of the Streamlit
+# script thread. Every job runs in its own workspace (see src/workspace.py),
+# which also holds a JSON status file that the worker keeps up to date, so the
+# UI polls the file rather than waiting on the render, and a browser refresh
+# can pick the job up again by its id.
+#
+# Status fields: id, owner, mode, state (queued, running, done, error or
+# cancelled), message, progress (0 to 1), output, error, profile (the stage
+# timings of a finished job) and the submitted/started/finished timestamps.
+
+ACTIVE_STATES = ('queued', 'running')
+STATUS_FILE = "status.json"
+
+def read_status(path):
+    """Returns the status dictionary stored at path, or None."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_status(path, status):
+    """Replaces a status file atomically, so readers never see half of it."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(status, f)
+    os.replace(tmp_path, path)
+
+class StatusReporter(ProgressReporter):
+    """Writes the progress of a queued job to its status file, at most every interval seconds."""
+
+    def __init__(self, path, status, interval=0.5):
+        self.path = path
+        self.data = status
+        self.interval = interval
+        self.last_write = 0.0
+        self.start_time = time.time()
+
+    def update(self, force=False, **fields):
+        self.data.update(fields)
+        now = time.monotonic()
+        if force or now - self.last_write >= self.interval:
+            write_status(self.path, self.data)
+            self.last_write = now
+
+    def status(self, message):
+        self.update(force=True, message=message)
+
+    def progress(self, fraction):
+        self.update(progress=min(fraction, 1.0))
+
+    def encoding(self, fraction):
+        if fraction == 0:
+            self.start_time = time.time()
+            return
+        elapsed_time = time.time() - self.start_time
+        remaining_time = elapsed_time / fraction - elapsed_time
+        mins, secs = divmod(int(remaining_time), 60)
+        self.update(progress=min(fraction, 1.0),
+                    message=f"Processing: {int(fraction * 100)}% - Remaining: {mins:02d}:{secs:02d}")
+
+def run_queued_job(job, workspace):
+    """
+    Worker entry point: renders a job with run_job, records the outcome in its
+    status file and ends the workspace. A failed render keeps only its status.
+    """
+    path = workspace.artifact_path(STATUS_FILE)
+    status = read_status(path) or {'id': job['id']}
+    reporter = StatusReporter(path, status)
+    reporter.update(force=True, state='running', message="Starting...", started=time.time())
+    try:
+        result = run_job(job, reporter)
+    finally:
+        workspace.finish()
+
+    if result['status'] == 'ok':
+        reporter.update(force=True, state='done', message="Video created successfully!", progress=1.0,
+                        finished=time.time(), profile=result['profile'])
+    else:
+        if os.path.exists(job['output']):
+            os.remove(job['output'])
+        reporter.update(force=True, state='error', message="Render failed.", error=result['error'],
+                        finished=time.time(), profile=result['profile'])
+    return result['status']
+
+class RenderQueue:
+    """
+    Bounded pool of render processes with a workspace and a status file per job.
+    At most max_pending jobs may be queued or running at once, and at most
+    max_per_owner of them per owner (e.g. a browser session). Jobs that were
+    still unfinished when a previous server process stopped are marked as failed
+    and their uploads and intermediates are deleted.
+    A worker that dies (e.g. killed for using too much memory) breaks the whole
+    pool: the jobs in it fail and the pool is replaced by a new one.
+    """
+
+    def __init__(self, workspaces=None, workers=RENDER_QUEUE_WORKERS,
+                 max_pending=RENDER_QUEUE_MAX_PENDING, max_per_owner=RENDER_QUEUE_MAX_PER_OWNER):
+        self.workspaces = workspaces or default_workspaces
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_per_owner = max_per_owner
+        self.jobs = {}  # job id -> (future, owner, submitted)
+        self.lock = threading.Lock()
+        os.makedirs(self.workspaces.directory, exist_ok=True)
+        self.recover()
+        self.executor = self.new_executor()
+
+    def new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def replace_executor(self, broken):
+        """Replaces a broken pool with a new one, unless that happened already. Call it holding the lock."""
+        if self.executor is broken:
+            self.executor = self.new_executor()
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    def status_path(self, job_id):
+        return os.path.join(self.workspaces.directory, job_id, STATUS_FILE)
+
+    def recover(self):
+        """
+        Marks jobs left queued or running by a previous server process as failed;
+        only their status files are kept.
+        """
+        for _, _, _, job_id in self.workspaces.entries():
+            path = self.status_path(job_id)
+            status = read_status(path)
+            if status and status.get('state') in ACTIVE_STATES:
+                status.update(state='error', message="Render failed.", error="The server restarted during the render.")
+                write_status(path, status)
+        self.workspaces.sweep(keep=(STATUS_FILE,))
+
+    def create_workspace(self):
+        """
+        Allocates the workspace of a job that is about to be submitted, so its
+        uploads can be saved to workspace.inputs first.
+        """
+        return self.workspaces.create()
+
+    def submit(self, job, owner=None, workspace=None):
+        """
+        Queues a job in the format of src.batch.normalize_job and returns its id,
+        the job_id of its workspace (a new one unless given). The output defaults
+        to output.mp4 in the workspace. The workspace is ended when the job ends,
+        and discarded if the job is refused or cannot be queued.
+        Raises RuntimeError when the queue, or the owner's share of it, is full.
+        """
+        workspace = workspace or self.create_workspace()
+        with self.lock:
+            try:
+                if len(self.jobs) >= self.max_pending:
+                    raise RuntimeError("The render queue is full. Please try again in a few minutes.")
+                if owner is not None and sum(1 for _, job_owner, _ in self.jobs.values() if job_owner == owner) >= self.max_per_owner:
+                    raise RuntimeError(f"You already have {self.max_per_owner} renders in progress.")
+            except RuntimeError:
+                workspace.discard()
+                raise
+
+            job_id = workspace.job_id
+            job = {'shards': ENCODE_SHARDS, **job, 'id': job_id, 'encoder': dict(job.get('encoder') or {})}
+            job.setdefault('output', workspace.artifact_path("output.mp4"))
+            job['scratch'] = workspace.scratch
+            # Give every running render a share of the cores, as run_batch does
+            cpu_count = os.cpu_count() or 1
+            if self.workers * job['shards'] > 1:
+                job['encoder'].setdefault('threads', max(1, cpu_count // (self.workers * job['shards'])))
+
+            path = self.status_path(job_id)
+            submitted = time.time()
+            write_status(path, {
+                'id': job_id,
+                'owner': owner,
+                'mode': job['mode'],
+                'state': 'queued',
+                'message': "Waiting in the render queue...",
+                'progress': 0.0,
+                'output': job['output'],
+                'submitted': submitted,
+            })
+            executor = self.executor
+            try:
+                try:
+                    future = executor.submit(run_queued_job, job, workspace)
+                except BrokenProcessPool:
+                    self.replace_executor(executor)
+                    executor = self.executor
+                    future = executor.submit(run_queued_job, job, workspace)
+            except Exception:
+                workspace.discard()
+                raise
+            self.jobs[job_id] = (future, owner, submitted)
+        future.add_done_callback(partial(self.finished, job, workspace, executor))
+        return job_id
+
+    def finished(self, job, workspace, executor, future):
+        """
+        Done callback: records jobs that were cancelled or whose worker died, and
+        replaces the pool of executor if a dead worker broke it.
+        """
+        with self.lock:
+            self.jobs.pop(job['id'], None)
+            if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+                self.replace_executor(executor)
+        if future.cancelled():
+            state, error = 'cancelled', None
+        elif future.exception() is not None:
+            state, error = 'error', f"The render process failed: {future.exception()}"
+        else:
+            return
+        # A dead worker leaves its partial output and temporary directories behind
+        workspace.discard(keep=(STATUS_FILE,))
+        if os.path.exists(job['output']):
+            os.remove(job['output'])
+        path = workspace.artifact_path(STATUS_FILE)
+        status = read_status(path) or {'id': job['id']}
+        status.update(state=state, message="Render cancelled." if state == 'cancelled' else "Render failed.",
+                      error=error, finished=time.time())
+        write_status(path, status)
+
+    def status(self, job_id):
+        """
+        Returns the status of a job, or None if the id is unknown or its workspace
+        was evicted. Queued jobs also get 'position', the number of jobs queued
+        ahead of them.
+        """
+        if self.workspaces.get(job_id) is None:
+            return None
+        status = read_status(self.status_path(job_id))
+        if status and status.get('state') == 'queued':
+            with self.lock:
+                status['position'] = sum(1 for future, _, submitted in self.jobs.values()
+                                         if not future.running() and submitted < status['submitted'])
+        return status
+
+    def cancel(self, job_id):
+        """Cancels a job that has not started yet. Returns True on success."""
+        with self.lock:
+            entry = self.jobs.get(job_id)
+        return bool(entry) and entry[0].cancel()
+
+    def shutdown(self, wait=True):
+        """Stops the workers; queued jobs are cancelled."""
+        self.executor.shutdown(wait=wait, cancel_futures=True)
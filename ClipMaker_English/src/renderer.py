@@ -0,0 +1,494 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+from src.constants import (SCREEN_SIZE, ENCODER_SETTINGS, ENCODE_SHARDS, STATIC_FRAME_COST, AUDIO_CODEC, MOTIONS,
+                           SCRATCH_BYTES_PER_PIXEL, CAPPED_SEGMENT_CRF)
+from src.cache import hash_key, link_or_copy
+from src.ingest import load_in_order
+from src.encoder import FrameWriter, encode_still, concat_videos, mux_audio, reencode_video
+from src.transitions import TransitionKernel
+from src.motion import motion_source_size, crop_boxes, MotionKernel
+from src.renditions import make_rendition, rendition_transform, output_args, save_poster
+from src.profiling import RenderProfiler
+
+def make_layer(image, start, duration, transition=None, transition_duration=0.0, motion=None, size=None):
+    """
+    Describes one slide on the timeline.
+    The transition is applied when the slide enters, over the layers below it.
+    With a motion (a MOTIONS name) the slide pans or zooms over image, which is
+    then larger than the frame (see src/motion.py) and size, the frame size, is required.
+    The timing is read once by plan.compile_plan; rendering takes it from the plan.
+    """
+    layer = {
+        'image': image,
+        'start': start,
+        'duration': duration,
+        'transition': transition,
+        'transition_duration': transition_duration if transition else 0.0,
+        'motion': motion,
+    }
+    if size is not None:
+        layer['size'] = tuple(size)
+    return layer
+
+def make_lazy_layer(load, key, start, duration, transition=None, transition_duration=0.0, motion=None, size=SCREEN_SIZE):
+    """
+    Describes a slide whose image is only produced when the render reaches it.
+    load() returns the frame as an array of the given size, or of
+    motion_source_size(size) for a slide with a motion; key is a JSON-serialisable
+    description of the source and parameters that identifies the image without decoding it.
+    """
+    layer = make_layer(None, start, duration, transition, transition_duration, motion, size)
+    layer.update({'load': load, 'key': key, 'source_size': motion_source_size(size) if motion else tuple(size)})
+    return layer
+
+def layer_image(layer):
+    """Returns the frame of a layer, loading it first if the layer is lazy."""
+    if layer['image'] is None:
+        layer['image'] = layer['load']()
+    return layer['image']
+
+def release_layer(layer):
+    """Drops the frame of a lazy layer; it is loaded again if needed."""
+    if 'load' in layer:
+        layer['image'] = None
+
+def image_size(layer):
+    """(width, height) of the image of a layer, which is larger than the frame for a slide with a motion."""
+    if 'source_size' in layer:
+        return layer['source_size']
+    height, width = layer['image'].shape[:2]
+    return (width, height)
+
+def timeline_size(layers):
+    """Returns the (width, height) of the timeline, taken from its slides."""
+    if not layers:
+        return SCREEN_SIZE
+    if 'size' in layers[0]:
+        return layers[0]['size']
+    height, width = layers[0]['image'].shape[:2]
+    return (width, height)
+
+def layer_digest(layer):
+    """
+    Hash of a layer's image, computed once per layer.
+    Lazy layers are hashed by their key so they do not need to be loaded.
+    """
+    if 'digest' not in layer:
+        if 'key' in layer:
+            layer['digest'] = hash_key(layer['key'])
+        else:
+            layer['digest'] = hashlib.blake2b(np.ascontiguousarray(layer['image']).data, digest_size=16).hexdigest()
+    return layer['digest']
+
+def segment_key(layers, plan, segment, encoder_settings=None, transform=None):
+    """
+    Hashes everything that determines the encoded frames of a segment: the images,
+    transitions and motions of its layers, their timing relative to the segment, its length,
+    the encoding parameters and the rendition transform (see src/renditions.py).
+    Moving a segment on the timeline keeps its key.
+    """
+    description = {
+        'kind': segment.kind,
+        'frames': segment.end_frame - segment.start_frame,
+        'fps': plan.fps,
+        'size': timeline_size(layers),
+        'encoder': {**ENCODER_SETTINGS, **(encoder_settings or {})},
+        'layers': [],
+    }
+    if transform is not None:
+        description['transform'] = transform
+    for index, offset in zip(segment.layers, segment.offsets):
+        layer_info = {'image': layer_digest(layers[index])}
+        if segment.kind == 'transition':
+            timing = plan.layers[index]
+            layer_info.update({
+                'offset': offset,
+                'transition': timing.transition,
+                'transition_duration': timing.transition_duration,
+            })
+        if plan.layers[index].motion:
+            layer_info.update({
+                'offset': offset,
+                'motion': MOTIONS[plan.layers[index].motion],
+                'duration': plan.layers[index].duration,
+            })
+        description['layers'].append(layer_info)
+    return hash_key(description)
+
+def motion_kernel(layers, plan, index, offset, num_frames, size):
+    """
+    MotionKernel drawing num_frames frames of a layer with a motion, the first
+    offset seconds after the slide started.
+    """
+    timing = plan.layers[index]
+    times = offset + np.arange(num_frames) / plan.fps
+    return MotionKernel(layer_image(layers[index]), crop_boxes(timing.motion, times, timing.duration,
+                                                               image_size(layers[index])), size)
+
+def render_transition(layers, plan, segment, writer, profiler=None):
+    """
+    Renders a transition or motion segment, compositing only the layers involved.
+    Each frame is rendered straight into one of the writer's buffers. Layers with
+    a motion get their crop boxes for the whole segment up front and are drawn
+    with one crop-resize per frame.
+    With a profiler, the compositing time of every frame is recorded as 'composite'.
+    """
+    size = timeline_size(layers)
+    num_frames = segment.end_frame - segment.start_frame
+    motions = {index: motion_kernel(layers, plan, index, offset, num_frames, size)
+               for index, offset in zip(segment.layers, segment.offsets) if plan.layers[index].motion}
+    base = segment.layers[0]
+    base_image = None if base in motions else layer_image(layers[base])
+    entering = [plan.layers[index] for index in segment.layers[1:]]
+    kernels = [TransitionKernel(timing.transition, motions[index].frame(0) if index in motions else layer_image(layers[index]),
+                                timing.transition_duration)
+               for index, timing in zip(segment.layers[1:], entering)]
+
+    for k, frame_index in enumerate(range(segment.start_frame, segment.end_frame)):
+        t = frame_index / plan.fps
+        out = writer.acquire()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        if base in motions:
+            # Alone, the slide is drawn straight into the writer's buffer
+            frame = motions[base].frame(k) if kernels else motions[base].render(k, out)
+        else:
+            frame = base_image
+        for index, timing, kernel in zip(segment.layers[1:], entering, kernels):
+            if index in motions:
+                kernel.set_image(motions[index].frame(k))
+            frame = kernel.render(frame, t - timing.start, out)
+        if profiler:
+            profiler.frame('composite', time.perf_counter() - wall_start, time.process_time() - cpu_start)
+        writer.submit(out)
+
+def render_frames(layers, plan, writer, profiler=None):
+    """
+    Writes every frame of a RenderPlan through a single writer.
+    Used for short, small renders such as transition previews.
+    """
+    for segment in plan.segments:
+        if segment.kind == 'static':
+            for _ in range(segment.end_frame - segment.start_frame):
+                if segment.layers:
+                    writer.write(layer_image(layers[segment.layers[0]]))
+                else:
+                    buffer = writer.acquire()
+                    buffer.fill(0)
+                    writer.submit(buffer)
+        else:
+            render_transition(layers, plan, segment, writer, profiler)
+
+def segment_output(path, size, encoder_settings=None, transform=None):
+    """One file a segment is encoded to: path, frame size, encoder settings and rendition transform."""
+    return {'path': path, 'size': tuple(size), 'encoder': encoder_settings, 'transform': transform}
+
+def encode_segment(layers, plan, segment, outputs, size, profiler=None):
+    """
+    Encodes one segment of the plan to each of outputs (see segment_output). The
+    layers it shows must already be loaded. The frames are composited once at the
+    timeline size; with several outputs a single ffmpeg process scales and encodes
+    them for all of them (see src/renditions.py).
+    """
+    profiler = profiler or RenderProfiler()
+    num_frames = segment.end_frame - segment.start_frame
+    path = outputs[0]['path']
+    args = None
+    if len(outputs) > 1 or outputs[0]['transform'] is not None:
+        args = output_args(outputs, size, plan.fps, num_frames if segment.kind == 'static' else None)
+    with profiler.stage('encode', frames=num_frames):
+        if segment.kind == 'static':
+            if segment.layers:
+                frame = layers[segment.layers[0]]['image']
+            else:
+                frame = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+            encode_still(frame, num_frames, path, plan.fps, outputs[0]['encoder'], output_args=args)
+        else:
+            with FrameWriter(path, size, plan.fps, outputs[0]['encoder'], output_args=args) as writer:
+                render_transition(layers, plan, segment, writer, profiler)
+
+def segment_cost(segment):
+    """Rough encoding cost of a segment, used to balance shards."""
+    num_frames = segment.end_frame - segment.start_frame
+    return num_frames * (STATIC_FRAME_COST if segment.kind == 'static' else 1.0)
+
+def plan_shards(segments, indices, count):
+    """
+    Splits the segments at indices into at most count runs of consecutive segments
+    with similar cost. Shards only break between segments, and every segment is
+    encoded on its own starting with a keyframe, so no transition is ever split
+    and the shards join without re-encoding.
+    """
+    costs = [segment_cost(segments[i]) for i in indices]
+    target = sum(costs) / max(1, count)
+    shards = [[]]
+    done = 0.0
+    for i, cost in zip(indices, costs):
+        if shards[-1] and len(shards) < count and done >= target * len(shards):
+            shards.append([])
+        shards[-1].append(i)
+        done += cost
+    return [shard for shard in shards if shard]
+
+def encode_shard(handle, descriptions, plan, indices, outputs, size):
+    """
+    Worker process entry point: attaches to the slide store and encodes the plan's
+    segments at indices to their outputs. Returns the profiler stages so the parent
+    can merge them.
+    """
+    from src.slide_store import SlideStore, attach_layers
+
+    store = SlideStore.attach(handle)
+    try:
+        layers = attach_layers(descriptions, store)
+        profiler = RenderProfiler()
+        for i, segment_outputs in zip(indices, outputs):
+            encode_segment(layers, plan, plan.segments[i], segment_outputs, size, profiler)
+        return profiler.stages
+    finally:
+        layers = None
+        store.close()
+
+def encode_sharded(layers, plan, outputs, size, shards, profiler, progress_callback=None):
+    """
+    Encodes the plan's segments in up to shards worker processes; outputs maps the
+    index of every segment to encode to its outputs (see segment_output). The slide
+    frames are handed over through a SlideStore. Unless the settings fix a thread
+    count, each encoder gets a share of the cores.
+    """
+    from src.slide_store import store_layers
+
+    segments = plan.segments
+    indices = sorted(outputs)
+    needed = {index for i in indices for index in segments[i].layers}
+    with profiler.stage('slide store', frames=len(needed)):
+        store, descriptions = store_layers(layers, needed)
+
+    threads = max(1, (os.cpu_count() or 1) // shards)
+    outputs = {i: [{**output, 'encoder': {'threads': threads, **(output['encoder'] or {})}} for output in outputs[i]]
+               for i in indices}
+    shard_plan = plan_shards(segments, indices, shards)
+    total_frames = plan.total_frames
+    encode_frames = sum(segments[i].end_frame - segments[i].start_frame for i in indices)
+    done_frames = total_frames - encode_frames
+
+    try:
+        with profiler.stage('sharded encode', frames=encode_frames):
+            # spawn rather than fork: the caller may be a threaded server such as Streamlit
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=len(shard_plan), mp_context=context) as executor:
+                futures = {
+                    executor.submit(encode_shard, store.handle(), descriptions, plan, shard,
+                                    [outputs[i] for i in shard], size): shard
+                    for shard in shard_plan
+                }
+                for future in as_completed(futures):
+                    profiler.merge(future.result(), prefix='shard ')
+                    done_frames += sum(segments[i].end_frame - segments[i].start_frame for i in futures[future])
+                    if progress_callback:
+                        progress_callback(done_frames / total_frames)
+    finally:
+        store.close()
+
+def scratch_directory(scratch_dir, fallback_dir, needed_bytes):
+    """
+    scratch_dir if its file system has needed_bytes free, otherwise fallback_dir.
+    None (the system temp directory) stays None.
+    """
+    if scratch_dir is None:
+        return None
+    try:
+        free = shutil.disk_usage(scratch_dir).free
+    except OSError:
+        return fallback_dir
+    return scratch_dir if free >= needed_bytes else fallback_dir
+
+def render_timeline(layers, plan, output_path, audio_path=None, progress_callback=None, encoder_settings=None, segment_cache=None, profiler=None, shards=ENCODE_SHARDS, audio_codec=AUDIO_CODEC, scratch_dir=None):
+    """
+    Renders a RenderPlan (see src/plan.py) to output_path, drawing plan layer i
+    with layers[i]. The single rendition case of render_renditions, which describes
+    the arguments.
+    """
+    render_renditions(layers, plan, [make_rendition(output_path)], audio_path, progress_callback, encoder_settings,
+                      segment_cache, profiler, shards, audio_codec, scratch_dir)
+    return output_path
+
+def poster_segment(plan):
+    """
+    The segment whose first frame a poster shows: the first one with a slide on
+    its own, else the first with any slide, or None for a black frame.
+    """
+    for segment in plan.segments:
+        if segment.kind != 'transition' and segment.layers:
+            return segment
+    for segment in plan.segments:
+        if segment.layers:
+            return segment
+    return None
+
+def render_renditions(layers, plan, renditions, audio_path=None, progress_callback=None, encoder_settings=None, segment_cache=None, profiler=None, shards=ENCODE_SHARDS, audio_codec=AUDIO_CODEC, scratch_dir=None):
+    """
+    Renders a RenderPlan (see src/plan.py) to every rendition (see
+    src/renditions.py), drawing plan layer i with layers[i]. Returns their paths.
+    Static holds are encoded from a single still, transitions are composited frame
+    by frame, and the pieces are joined without re-encoding before the audio is muxed.
+    Each frame is composited once and handed to one encoder per rendition, so extra
+    renditions only add their scaling and encoding.
+    encoder_settings overrides entries of ENCODER_SETTINGS; the encoder settings of
+    a rendition override both. A rendition with a maxrate is joined from uncapped
+    segments (see CAPPED_SEGMENT_CRF) and then encoded once more as a whole, since
+    a cap enforced per segment does not hold for the joined stream.
+    With a segment_cache, segments encoded by earlier renders are reused and only
+    segments whose inputs changed are encoded again, for the renditions that miss them.
+    The segments used are linked into the temporary directory, so trimming the
+    cache from another render cannot remove them before they are joined.
+    Lazy layers are loaded shortly before their first uncached segment is encoded
+    (at most INGEST_MAX_IN_FLIGHT ahead, see ingest.load_in_order) and released
+    after their last segment, so memory depends on how many slides overlap rather
+    than on the length of the timeline.
+    With shards > 1 the segments are encoded in that many processes (see encode_sharded).
+    audio_codec is passed to mux_audio; 'copy' muxes an already prepared track as is.
+    Segments go to a temporary directory inside scratch_dir (default: the system
+    temp directory) when it has room for them (see SCRATCH_BYTES_PER_PIXEL), else
+    next to the first rendition; the joined videos always go next to the renditions.
+    Both directories are removed afterwards.
+    The time spent in each step is recorded in profiler (a RenderProfiler) when given.
+    """
+    profiler = profiler or RenderProfiler()
+    segments = plan.segments
+    if not segments:
+        raise ValueError("Nothing to render: the timeline is empty")
+
+    total_frames = plan.total_frames
+    size = timeline_size(layers)
+    videos = [rendition for rendition in renditions if not rendition['poster']]
+    posters = [rendition for rendition in renditions if rendition['poster']]
+    settings = [{**(encoder_settings or {}), **rendition['encoder']} for rendition in videos]
+    segment_settings = [{**s, 'maxrate': None, 'crf': CAPPED_SEGMENT_CRF} if s.get('maxrate') else s for s in settings]
+    transforms = [rendition_transform(rendition, size) for rendition in videos]
+    output_dir = os.path.dirname(os.path.abspath(renditions[0]['path']))
+    segment_bytes = sum(total_frames * width * height * SCRATCH_BYTES_PER_PIXEL
+                        for width, height in (rendition['size'] or size for rendition in videos))
+    work_dir = tempfile.mkdtemp(prefix="clipmaker_", dir=scratch_directory(scratch_dir, output_dir, segment_bytes))
+    join_dir = tempfile.mkdtemp(prefix="clipmaker_", dir=output_dir)
+
+    names = [[None] * len(segments) for _ in videos]
+    segment_paths = [[None] * len(segments) for _ in videos]
+    if segment_cache:
+        for v in range(len(videos)):
+            for i, segment in enumerate(segments):
+                with profiler.stage('cache lookup'):
+                    names[v][i] = segment_key(layers, plan, segment, segment_settings[v], transforms[v]) + ".mp4"
+                    segment_paths[v][i] = segment_cache.pin(names[v][i], os.path.join(work_dir, f"segment_{i:05d}_{v}.mp4"))
+    outputs = {}
+    for i in range(len(segments)):
+        missing = [v for v in range(len(videos)) if segment_paths[v][i] is None]
+        if missing:
+            outputs[i] = [(v, segment_output(os.path.join(work_dir, f"segment_{i:05d}_{v}.mp4"),
+                                             videos[v]['size'] or size, segment_settings[v], transforms[v]))
+                          for v in missing]
+    to_encode = sorted(outputs)
+
+    # Only segments that are encoded need their layers. Lazy layers with the same
+    # source (e.g. a photo used twice) share one load, released after the last
+    # segment that shows any of them
+    def source(index):
+        return layer_digest(layers[index]) if 'key' in layers[index] else index
+
+    last_use = {}
+    holders = {}
+    for i in to_encode:
+        for index in segments[i].layers:
+            last_use[source(index)] = i
+            holders.setdefault(source(index), set()).add(index)
+
+    def loaded(index):
+        """The frame of a layer or of another layer with the same source, or None."""
+        return next((layers[other]['image'] for other in holders[source(index)]
+                     if layers[other]['image'] is not None), None)
+
+    def load_and_encode(segment, segment_outputs, loads):
+        for index in segment.layers:
+            if layers[index]['image'] is None:
+                layers[index]['image'] = loaded(index)
+            if layers[index]['image'] is None:
+                with profiler.stage('slide load', frames=1):
+                    layers[index]['image'] = next(loads)
+        encode_segment(layers, plan, segment, segment_outputs, size, profiler)
+
+    loads = None
+    try:
+        sharded = False
+        if shards > 1 and len(to_encode) > 1:
+            encode_sharded(layers, plan, {i: [output for _, output in outputs[i]] for i in to_encode},
+                           size, shards, profiler, progress_callback)
+            sharded = True
+        else:
+            # The sources still to load, in the order the segments first need them,
+            # are loaded ahead of the encoder by a bounded pool of threads
+            first_use = {}
+            for i in to_encode:
+                for index in segments[i].layers:
+                    if loaded(index) is None:
+                        first_use.setdefault(source(index), index)
+            loads = load_in_order(layers[index]['load'] for index in first_use.values())
+
+        for i, segment in enumerate(segments):
+            if i in outputs:
+                if not sharded:
+                    load_and_encode(segment, [output for _, output in outputs[i]], loads)
+                    for index in segment.layers:
+                        if last_use[source(index)] == i:
+                            for holder in holders[source(index)]:
+                                release_layer(layers[holder])
+                for v, output in outputs[i]:
+                    if segment_cache:
+                        segment_cache.store(names[v][i], lambda tmp_path: link_or_copy(output['path'], tmp_path))
+                    segment_paths[v][i] = output['path']
+            if progress_callback and not sharded:
+                progress_callback(segment.end_frame / total_frames)
+
+        for v, rendition in enumerate(videos):
+            extension = os.path.splitext(rendition['path'])[1]
+            capped = bool(settings[v].get('maxrate'))
+            video_path = os.path.join(join_dir, f"video_{v}{extension}") if audio_path or capped else rendition['path']
+            with profiler.stage('concat'):
+                concat_videos(segment_paths[v], video_path)
+            if capped:
+                capped_path = os.path.join(join_dir, f"capped_{v}{extension}") if audio_path else rendition['path']
+                with profiler.stage('capped encode', frames=total_frames):
+                    reencode_video(video_path, capped_path, plan.fps, settings[v])
+                video_path = capped_path
+            if audio_path:
+                with profiler.stage('audio mux'):
+                    mux_audio(video_path, audio_path, rendition['path'], total_frames / plan.fps, audio_codec)
+
+        if posters:
+            with profiler.stage('poster', frames=len(posters)):
+                segment = poster_segment(plan)
+                if segment is None:
+                    frame = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+                elif plan.layers[segment.layers[0]].motion:
+                    frame = motion_kernel(layers, plan, segment.layers[0], segment.offsets[0], 1, size).frame(0)
+                else:
+                    frame = layer_image(layers[segment.layers[0]])
+                for rendition in posters:
+                    save_poster(frame, rendition)
+                if segment is not None:
+                    release_layer(layers[segment.layers[0]])
+
+        return [rendition['path'] for rendition in renditions]
+    finally:
+        if loads is not None:
+            loads.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+        shutil.rmtree(join_dir, ignore_errors=True)
+        if segment_cache:
+            segment_cache.trim()
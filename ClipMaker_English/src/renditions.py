@@ -0,0 +1,195 @@
+import os
+import numpy as np
+from PIL import Image
+
+from src.constants import RENDITION_POSTER_EXTENSIONS, RENDITION_POSTER_QUALITY, RENDITION_RESAMPLE, RENDITION_PRESETS
+from src.encoder import video_codec_args
+
+# A render can produce several renditions of the same timeline: e.g. the full
+# size video, a smaller one for mobile, a vertical cut and a poster image.
+# Every frame is composited once at the timeline size and piped to a single
+# ffmpeg process that crops, scales and encodes it for every rendition.
+# Renditions with the same size share one scaled stream, and smaller full-frame
+# renditions are scaled from the smallest larger one instead of from the full
+# size frame.
+
+def make_rendition(path, size=None, fit='pad', encoder_settings=None):
+    """
+    Describes one output of a render. The container follows the extension of path
+    (.mp4, .mov, .mkv...); a .jpg path is a poster image of the first slide.
+    size is the (width, height) of the output, default the timeline size.
+    fit 'pad' shows the whole frame with black bars where the aspect ratio differs,
+    'crop' fills the output and cuts the sides, e.g. for a vertical cut of a
+    landscape clip. encoder_settings override the settings of the render.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if fit not in ('pad', 'crop'):
+        raise ValueError(f"Unknown fit '{fit}'")
+    if size is not None:
+        size = (int(size[0]), int(size[1]))
+        if size[0] <= 0 or size[1] <= 0 or size[0] % 2 or size[1] % 2:
+            raise ValueError(f"Rendition size must be positive and even, got {size[0]}x{size[1]}")
+    return {
+        'path': path,
+        'size': size,
+        'fit': fit,
+        'encoder': dict(encoder_settings or {}),
+        'poster': extension in RENDITION_POSTER_EXTENSIONS,
+    }
+
+def clamp_size(size, fit, source_size):
+    """
+    size, scaled down (keeping it even) if frames of source_size would have to be
+    upscaled to fill it with the given fit.
+    """
+    scale = (max if fit == 'crop' else min)(size[0] / source_size[0], size[1] / source_size[1])
+    if scale <= 1:
+        return tuple(size)
+    return (max(2, round(size[0] / scale / 2) * 2), max(2, round(size[1] / scale / 2) * 2))
+
+def preset_rendition(preset, path, source_size=None):
+    """
+    Makes a rendition from one of RENDITION_PRESETS. With source_size, the size of
+    the rendered frames (e.g. of the render profile), a preset larger than the
+    frames is scaled down to them (see clamp_size).
+    """
+    if preset not in RENDITION_PRESETS:
+        raise ValueError(f"Unknown rendition preset '{preset}'")
+    settings = RENDITION_PRESETS[preset]
+    size = settings.get('size')
+    if size is not None and source_size is not None:
+        size = clamp_size(size, settings.get('fit', 'pad'), source_size)
+    return make_rendition(path, size, settings.get('fit', 'pad'), settings.get('encoder'))
+
+def rendition_transform(rendition, source_size):
+    """
+    Returns how a frame of source_size becomes a frame of the rendition, as a
+    hashable (box, scaled_size, size) tuple: the box of the source is scaled to
+    scaled_size and centered on a black frame of size. None if the frame is used as is.
+    """
+    size = rendition['size'] or tuple(source_size)
+    if size == tuple(source_size):
+        return None
+    source_width, source_height = source_size
+    width, height = size
+    if rendition['fit'] == 'crop':
+        scale = max(width / source_width, height / source_height)
+        crop_width = min(source_width, round(width / scale))
+        crop_height = min(source_height, round(height / scale))
+        left = (source_width - crop_width) // 2
+        top = (source_height - crop_height) // 2
+        return ((left, top, left + crop_width, top + crop_height), size, size)
+    scale = min(width / source_width, height / source_height)
+    scaled_size = (min(width, round(source_width * scale)), min(height, round(source_height * scale)))
+    return ((0, 0, source_width, source_height), scaled_size, size)
+
+def pad_frame(image, size):
+    """Centers an image on a black frame of size (width, height)."""
+    height, width = image.shape[:2]
+    if (width, height) == tuple(size):
+        return image
+    out = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+    x = (size[0] - width) // 2
+    y = (size[1] - height) // 2
+    out[y:y + height, x:x + width] = image
+    return out
+
+def transform_frame(frame, transform):
+    """Applies a rendition_transform to a single frame, e.g. for a poster."""
+    if transform is None:
+        return frame
+    box, scaled_size, size = transform
+    image = Image.fromarray(frame).resize(scaled_size, Image.Resampling[RENDITION_RESAMPLE.upper()], box=box)
+    return pad_frame(np.asarray(image), size)
+
+def scaling_steps(transforms, source_size):
+    """
+    Orders the distinct transforms so each is scaled from the best available
+    image: a full-frame transform starts from the smallest full-frame image
+    already scaled that is at least as large, the others from the source frame.
+    Returns (transform, parent transform or None, box in the parent) tuples.
+    """
+    full_box = (0, 0, source_size[0], source_size[1])
+    transforms = sorted({t for t in transforms if t is not None},
+                        key=lambda t: (t[0] != full_box, -t[1][0] * t[1][1]))
+    steps = []
+    scaled = []
+    for transform in transforms:
+        box, scaled_size, _ = transform
+        parent = None
+        if box == full_box:
+            larger = [t for t in scaled if t[1][0] >= scaled_size[0] and t[1][1] >= scaled_size[1]]
+            if larger:
+                parent = larger[-1]
+                box = (0, 0) + parent[1]
+            scaled.append(transform)
+        steps.append((transform, parent, box))
+    return steps
+
+def filter_graph(transforms, source_size):
+    """
+    Builds an ffmpeg filter graph from the first input to one stream per
+    transform, following scaling_steps: every distinct crop and scale is done
+    once and shared by the transforms that need it.
+    Returns the graph (None if every transform is None) and the stream specifier
+    for -map of each transform, in order.
+    """
+    nodes = {}  # name -> (input name, filter); 'in' is the input frame
+    scaled = {}  # (box, scaled size) -> name
+    streams = {}
+    for transform, parent, box in scaling_steps(transforms, source_size):
+        (width, height), (out_width, out_height) = transform[1], transform[2]
+        if transform[:2] not in scaled:
+            parent_size = parent[1] if parent else tuple(source_size)
+            left, top, right, bottom = box
+            scale = f"scale={width}:{height}:flags={RENDITION_RESAMPLE}"
+            if box != (0, 0) + parent_size:
+                scale = f"crop={right - left}:{bottom - top}:{left}:{top},{scale}"
+            scaled[transform[:2]] = f"s{len(scaled)}"
+            nodes[scaled[transform[:2]]] = (scaled[parent[:2]] if parent else 'in', scale)
+        streams[transform] = scaled[transform[:2]]
+        if (width, height) != (out_width, out_height):
+            streams[transform] = f"p{len(streams)}"
+            nodes[streams[transform]] = (scaled[transform[:2]],
+                                         f"pad={out_width}:{out_height}:{(out_width - width) // 2}:{(out_height - height) // 2}")
+    if not nodes:
+        return None, ['0:v'] * len(transforms)
+
+    # A stream used more than once is split into copies first
+    consumers = [source for source, _ in nodes.values()] + [streams[t] for t in transforms if t is not None]
+    labels = {}
+    graph = []
+    for name in dict.fromkeys(consumers):
+        count = consumers.count(name)
+        label = '0:v' if name == 'in' else name
+        if count > 1:
+            copies = [f"{name}_{k}" for k in range(count)]
+            labels[name] = iter(copies)
+            graph.append(f"[{label}]split={count}" + "".join(f"[{copy}]" for copy in copies))
+        else:
+            labels[name] = iter([label])
+    for name, (source, chain) in nodes.items():
+        graph.append(f"[{next(labels[source])}]{chain}[{name}]")
+    return ";".join(graph), ['0:v' if t is None else f"[{next(labels[streams[t]])}]" for t in transforms]
+
+def output_args(outputs, source_size, fps, num_frames=None):
+    """
+    ffmpeg arguments that encode the first input, of source_size, to several
+    outputs ({'path', 'size', 'encoder', 'transform'} dictionaries) at once.
+    num_frames limits the outputs, e.g. for a looped still.
+    """
+    graph, streams = filter_graph([output['transform'] for output in outputs], source_size)
+    args = ["-filter_complex", graph] if graph else []
+    for output, stream in zip(outputs, streams):
+        args += ["-map", stream] + video_codec_args(fps, output['encoder'])
+        if num_frames is not None:
+            args += ["-frames:v", str(num_frames)]
+        args.append(output['path'])
+    return args
+
+def save_poster(frame, rendition, quality=RENDITION_POSTER_QUALITY):
+    """Saves a frame as the JPEG poster of a rendition."""
+    frame = transform_frame(frame, rendition_transform(rendition, (frame.shape[1], frame.shape[0])))
+    tmp_path = f"{rendition['path']}.{os.getpid()}.tmp"
+    Image.fromarray(frame).save(tmp_path, format="JPEG", quality=quality)
+    os.replace(tmp_path, rendition['path'])
@@ -0,0 +1,179 @@
+import os
+import sys
+import uuid
+from functools import partial
+import numpy as np
+from multiprocessing import shared_memory
+
+from src.constants import SCREEN_SIZE, SLIDE_STORE_BACKING, SLIDE_STORE_DIR
+from src.renderer import layer_image, layer_digest, release_layer, image_size
+from src.ingest import load_in_order
+
+# All slide frames of a render in one contiguous uint8 buffer, slot after slot,
+# each a (height, width, 3) frame in the create_slide_image / resize_and_pad_image
+# format. Slots are the frame size, or larger for the source of a slide with a
+# motion. The owner fills the buffer once; worker processes attach with the small
+# handle() dictionary and read the frames as zero-copy views instead of receiving
+# pickled arrays.
+
+class SlideStore:
+    """
+    Fixed-size array of slide frames backed by shared memory or a memory-mapped file.
+    Use SlideStore.create() in the owning process and SlideStore.attach() in workers.
+    """
+
+    def __init__(self, backing, name, sizes, writable, owner):
+        self.backing = backing
+        self.name = name
+        self.sizes = [tuple(size) for size in sizes]
+        self.count = len(self.sizes)
+        self.owner = owner
+        self.index = {}
+        self.shm = None
+        self.offsets = [0]
+        for width, height in self.sizes:
+            self.offsets.append(self.offsets[-1] + width * height * 3)
+        shape = (max(1, self.offsets[-1]),)
+
+        if backing == 'shm':
+            if owner:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=shape[0])
+            elif sys.version_info >= (3, 13):
+                # Workers must not unlink the segment when they exit
+                self.shm = shared_memory.SharedMemory(name=name, track=False)
+            else:
+                self.shm = shared_memory.SharedMemory(name=name)
+            self.frames = np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf)
+        elif backing == 'mmap':
+            mode = 'w+' if owner else ('r+' if writable else 'r')
+            self.frames = np.memmap(name, dtype=np.uint8, mode=mode, shape=shape)
+        else:
+            raise ValueError(f"Unknown slide store backing: {backing!r}")
+
+        if not writable:
+            self.frames.flags.writeable = False
+
+    @classmethod
+    def create(cls, count, size=SCREEN_SIZE, backing=SLIDE_STORE_BACKING, directory=SLIDE_STORE_DIR, sizes=None):
+        """
+        Allocates an empty store for count frames of the given (width, height), or
+        for one frame of each (width, height) in sizes.
+        """
+        if backing == 'mmap':
+            name = os.path.join(directory, f"clipmaker_slides_{uuid.uuid4().hex}.bin")
+        else:
+            name = f"clipmaker_{uuid.uuid4().hex[:16]}"
+        return cls(backing, name, sizes if sizes is not None else [size] * count, writable=True, owner=True)
+
+    @classmethod
+    def attach(cls, handle, writable=False):
+        """Opens a store created in another process from its handle()."""
+        store = cls(handle['backing'], handle['name'], handle['sizes'], writable, owner=False)
+        store.index = dict(handle['index'])
+        return store
+
+    def handle(self):
+        """A small picklable description that workers pass to attach()."""
+        return {
+            'backing': self.backing,
+            'name': self.name,
+            'sizes': list(self.sizes),
+            'index': dict(self.index),
+        }
+
+    def put(self, slot, image, key=None):
+        """Copies a frame into a slot; key, when given, is recorded in the index."""
+        self.view(slot)[...] = image
+        if key is not None:
+            self.index[key] = slot
+
+    def view(self, slot):
+        """The (height, width, 3) array of a slot."""
+        width, height = self.sizes[slot]
+        return self.frames[self.offsets[slot]:self.offsets[slot + 1]].reshape(height, width, 3)
+
+    def get(self, slot):
+        """Returns a read-only view of a slot without copying."""
+        view = self.view(slot)
+        if self.backing == 'mmap':
+            view = np.asarray(view)
+        view.flags.writeable = False
+        return view
+
+    def lookup(self, key):
+        """Returns the view stored under key, or None."""
+        slot = self.index.get(key)
+        return None if slot is None else self.get(slot)
+
+    def close(self):
+        """Detaches from the store. The owner also deletes it."""
+        self.frames = None
+        if self.backing == 'shm':
+            if self.owner:
+                self.shm.unlink()
+            try:
+                self.shm.close()
+            except BufferError:
+                # Views handed out by get() are still alive; the mapping goes away with them
+                pass
+        elif self.owner:
+            try:
+                os.remove(self.name)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def store_layers(layers, needed=None, backing=SLIDE_STORE_BACKING):
+    """
+    Writes the frames of the layers into a new store, loading lazy layers in a
+    bounded pool of threads (see ingest.load_in_order) and releasing them again.
+    needed limits this to some layer indices; the others get no slot. Layers
+    showing the same frame (equal digests) share a slot.
+    Returns the store and a copy of the layers without images that refers to the
+    slots instead; the copy can be pickled to workers and turned back into layers
+    with attach_layers().
+    """
+    needed = range(len(layers)) if needed is None else sorted(needed)
+    slots = {}
+    digest_slots = {}
+    sizes = []
+    fill = []
+    for index in needed:
+        digest = layer_digest(layers[index])
+        if digest not in digest_slots:
+            digest_slots[digest] = len(sizes)
+            sizes.append(image_size(layers[index]))
+            fill.append(index)
+        slots[index] = digest_slots[digest]
+    store = SlideStore.create(len(sizes), backing=backing, sizes=sizes)
+    descriptions = []
+    try:
+        for index, image in zip(fill, load_in_order(partial(layer_image, layers[index]) for index in fill)):
+            store.put(slots[index], image, key=layer_digest(layers[index]))
+            release_layer(layers[index])
+        for index, layer in enumerate(layers):
+            slot = slots.get(index)
+            if slot is not None:
+                release_layer(layer)
+            description = {key: value for key, value in layer.items() if key not in ('image', 'load')}
+            description.update({'image': None, 'slot': slot, 'digest': layer_digest(layer)})
+            descriptions.append(description)
+    except Exception:
+        store.close()
+        raise
+    return store, descriptions
+
+def attach_layers(descriptions, store):
+    """Rebuilds layers from store_layers() descriptions with views into the store."""
+    layers = []
+    for description in descriptions:
+        layer = dict(description)
+        if description['slot'] is not None:
+            layer['image'] = store.get(description['slot'])
+        layers.append(layer)
+    return layers
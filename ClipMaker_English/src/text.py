@@ -0,0 +1,60 @@
+from functools import lru_cache
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+from src.constants import TEXT_FONT_PATHS, TEXT_SPRITE_CACHE_SIZE
+
+# Text overlays are rendered once into small alpha sprites and blended onto the
+# slide in NumPy, so changing the text of a slide never redraws or re-decodes
+# the picture underneath.
+
+@lru_cache(maxsize=32)
+def get_font(size, font_path=None):
+    """
+    Loads a font once per process. Tries font_path, then TEXT_FONT_PATHS, and
+    falls back to Pillow's built-in scalable font.
+    """
+    candidates = ([font_path] if font_path else []) + TEXT_FONT_PATHS
+    for candidate in candidates:
+        try:
+            return ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size)
+
+@lru_cache(maxsize=TEXT_SPRITE_CACHE_SIZE)
+def text_sprite(text, size, font_path=None):
+    """
+    Renders text into an alpha mask cropped to its bounding box.
+    Returns the read-only mask and its (x, y) offset from the text center.
+    """
+    font = get_font(size, font_path)
+    measure = ImageDraw.Draw(Image.new('L', (1, 1)))
+    left, top, right, bottom = measure.textbbox((0, 0), text, font=font, anchor="mm")
+    mask = Image.new('L', (max(1, right - left), max(1, bottom - top)), 0)
+    ImageDraw.Draw(mask).text((-left, -top), text, font=font, fill=255, anchor="mm")
+    alpha = np.array(mask)
+    alpha.flags.writeable = False
+    return alpha, (left, top)
+
+def overlay_text(image, text, color, size, font_path=None):
+    """
+    Returns a copy of an RGB frame with text of the given pixel size centered on it.
+    """
+    alpha, (left, top) = text_sprite(text, size, font_path)
+    out = np.array(image)
+    height, width = out.shape[:2]
+
+    # Place the sprite and clip it to the frame
+    x0, y0 = width // 2 + left, height // 2 + top
+    x1, y1 = x0 + alpha.shape[1], y0 + alpha.shape[0]
+    cx0, cy0 = max(x0, 0), max(y0, 0)
+    cx1, cy1 = min(x1, width), min(y1, height)
+    if cx0 >= cx1 or cy0 >= cy1:
+        return out
+
+    a = alpha[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0, np.newaxis].astype(np.uint16)
+    region = out[cy0:cy1, cx0:cx1].astype(np.uint16)
+    rgb = np.array(ImageColor.getrgb(color)[:3], dtype=np.uint16)
+    out[cy0:cy1, cx0:cx1] = ((region * (255 - a) + rgb * a + 127) // 255).astype(np.uint8)
+    return out
@@ -0,0 +1,246 @@
+import math
+from functools import lru_cache
+import numpy as np
+
+# NumPy versions of the moviepy effect chain in video_processor.apply_transition_effect.
+# The geometry follows moviepy exactly (offsets, sizes, top-left anchoring and the
+# expanded rotation box); resampling is bilinear from a box-filtered pyramid instead
+# of PIL's LANCZOS/bicubic, which is visually equivalent at video bitrates.
+
+SLIDE_SIDES = {
+    'slide_left': 'right',
+    'slide_right': 'left',
+    'slide_up': 'bottom',
+    'slide_down': 'top',
+}
+
+def zoom_scale(t, duration):
+    """Scale factor used by the zoom_in and spin_in transitions."""
+    return 0.1 + 0.9 * (t / duration) if t < duration else 1.0
+
+def spin_angle(t, duration):
+    """Rotation angle in degrees used by the spin_in transition."""
+    return 360 * (t / duration) if t < duration else 0
+
+def rotation_matrix(angle, width, height):
+    """
+    Returns the output-to-input affine matrix and the expanded size of
+    PIL's Image.rotate(angle, expand=True) for an image of the given size.
+    """
+    angle = -math.radians(angle)
+    matrix = [
+        round(math.cos(angle), 15),
+        round(math.sin(angle), 15),
+        0.0,
+        round(-math.sin(angle), 15),
+        round(math.cos(angle), 15),
+        0.0,
+    ]
+
+    def transform(x, y):
+        a, b, c, d, e, f = matrix
+        return a * x + b * y + c, d * x + e * y + f
+
+    center_x, center_y = width / 2, height / 2
+    matrix[2], matrix[5] = transform(-center_x, -center_y)
+    matrix[2] += center_x
+    matrix[5] += center_y
+
+    xs, ys = zip(*(transform(x, y) for x, y in ((0, 0), (width, 0), (width, height), (0, height))))
+    new_width = math.ceil(max(xs)) - math.floor(min(xs))
+    new_height = math.ceil(max(ys)) - math.floor(min(ys))
+    matrix[2], matrix[5] = transform(-(new_width - width) / 2.0, -(new_height - height) / 2.0)
+    return matrix, new_width, new_height
+
+@lru_cache(maxsize=64)
+def pixel_centers(width, height):
+    """Cached grid of output pixel centers, shared by all frames of a given size."""
+    xs = np.arange(width, dtype=np.float32) + 0.5
+    ys = np.arange(height, dtype=np.float32) + 0.5
+    return xs[np.newaxis, :], ys[:, np.newaxis]
+
+def build_pyramid(image, min_size=16):
+    """Returns the image followed by successive 2x box-filtered reductions."""
+    levels = [image]
+    current = image.astype(np.float32)
+    while min(current.shape[0], current.shape[1]) >= 2 * min_size:
+        h, w = current.shape[0] // 2 * 2, current.shape[1] // 2 * 2
+        current = current[:h, :w].reshape(h // 2, 2, w // 2, 2, 3).mean(axis=(1, 3))
+        levels.append(current.astype(np.uint8))
+    return levels
+
+def pick_level(pyramid, scale):
+    """Chooses the pyramid level whose resolution is closest above the requested scale."""
+    level = 0
+    while level + 1 < len(pyramid) and scale <= 0.5 ** (level + 1):
+        level += 1
+    return level
+
+def sample_bilinear(source, src_x, src_y, out):
+    """
+    Samples source at the given continuous coordinates (pixel centers at +0.5)
+    and writes the result into out. Samples outside the source are black.
+    """
+    h, w = source.shape[:2]
+    x = src_x - 0.5
+    y = src_y - 0.5
+    inside = (x > -1) & (x < w) & (y > -1) & (y < h)
+
+    x0 = np.floor(x)
+    y0 = np.floor(y)
+    fx = (x - x0)[..., np.newaxis]
+    fy = (y - y0)[..., np.newaxis]
+    x0 = x0.astype(np.intp)
+    y0 = y0.astype(np.intp)
+    x1 = np.clip(x0 + 1, 0, w - 1)
+    y1 = np.clip(y0 + 1, 0, h - 1)
+    np.clip(x0, 0, w - 1, out=x0)
+    np.clip(y0, 0, h - 1, out=y0)
+
+    flat = source.reshape(-1, 3)
+    top = flat[y0 * w + x0] * (1 - fx) + flat[y0 * w + x1] * fx
+    bottom = flat[y1 * w + x0] * (1 - fx) + flat[y1 * w + x1] * fx
+    result = top * (1 - fy) + bottom * fy
+    result[~inside] = 0
+    np.copyto(out, result, casting='unsafe')
+
+def resize_separable(source, width, height, out):
+    """
+    Bilinear resize without rotation, done as two 1D gathers in 8-bit fixed point.
+    """
+    h, w = source.shape[:2]
+    xs, ys = pixel_centers(width, height)
+    x = xs[0] * (w / width) - 0.5
+    y = ys[:, 0] * (h / height) - 0.5
+    x0 = np.clip(np.floor(x).astype(np.intp), 0, w - 1)
+    y0 = np.clip(np.floor(y).astype(np.intp), 0, h - 1)
+    x1 = np.clip(x0 + 1, 0, w - 1)
+    y1 = np.clip(y0 + 1, 0, h - 1)
+    fx = (np.clip(x - x0, 0, 1) * 256).astype(np.uint16)[np.newaxis, :, np.newaxis]
+    fy = (np.clip(y - y0, 0, 1) * 256).astype(np.uint16)[:, np.newaxis, np.newaxis]
+
+    rows = np.multiply(source[y0], 256 - fy, dtype=np.uint16)
+    rows += np.multiply(source[y1], fy, dtype=np.uint16)
+    rows >>= 8
+    result = rows[:, x0]
+    result *= 256 - fx
+    right = rows[:, x1]
+    right *= fx
+    result += right
+    result >>= 8
+    np.copyto(out, result, casting='unsafe')
+
+class TransitionKernel:
+    """
+    Renders one slide entering over a base frame, writing into a caller-owned buffer.
+    Everything that does not depend on time (pyramid, scratch buffers) is built once.
+    """
+
+    def __init__(self, trans_type, image, duration):
+        self.trans_type = trans_type
+        self.image = image
+        self.duration = duration
+        self.height, self.width = image.shape[:2]
+        self.pyramid = None
+        self.scratch = None
+
+        if trans_type in ('zoom_in', 'spin_in'):
+            self.pyramid = build_pyramid(image)
+        elif trans_type == 'crossfade':
+            self.scratch = (np.empty(image.shape, np.uint16), np.empty(image.shape, np.uint16))
+
+    def set_image(self, image):
+        """Replaces the entering frame, e.g. with the next frame of a slide in motion."""
+        self.image = image
+        if self.pyramid is not None:
+            self.pyramid = build_pyramid(image)
+
+    def render(self, base, t, out):
+        """
+        Writes the frame at clip time t into out and returns it.
+        out may be the same array as base.
+        """
+        if t >= self.duration or self.trans_type not in TRANSITION_RENDERERS:
+            np.copyto(out, self.image)
+            return out
+        TRANSITION_RENDERERS[self.trans_type](self, base, t, out)
+        return out
+
+    def crossfade(self, base, t, out):
+        # Same quantisation as moviepy: the float mask is truncated to uint8 before blending
+        alpha = int(1.0 * t / self.duration * 255)
+        blend, rest = self.scratch
+        np.multiply(self.image, alpha, out=blend, dtype=np.uint16)
+        np.multiply(base, 255 - alpha, out=rest, dtype=np.uint16)
+        blend += rest
+        blend += 127
+        np.floor_divide(blend, 255, out=blend)
+        np.copyto(out, blend, casting='unsafe')
+
+    def slide(self, base, t, out):
+        w, h = self.width, self.height
+        side = SLIDE_SIDES[self.trans_type]
+        progress = t / self.duration
+        if side == 'right':
+            x = int(max(0, w * (1 - progress)))
+            if out is not base:
+                out[:, :x] = base[:, :x]
+            out[:, x:] = self.image[:, :w - x]
+        elif side == 'left':
+            x = -int(min(0, w * (progress - 1)))
+            out[:, :w - x] = self.image[:, x:]
+            if out is not base:
+                out[:, w - x:] = base[:, w - x:]
+        elif side == 'bottom':
+            y = int(max(0, h * (1 - progress)))
+            if out is not base:
+                out[:y] = base[:y]
+            out[y:] = self.image[:h - y]
+        else:
+            y = -int(min(0, h * (progress - 1)))
+            out[:h - y] = self.image[y:]
+            if out is not base:
+                out[h - y:] = base[h - y:]
+
+    def zoom(self, base, t, out):
+        scale = zoom_scale(t, self.duration)
+        new_w, new_h = int(scale * self.width), int(scale * self.height)
+        if out is not base:
+            np.copyto(out, base)
+        if new_w == 0 or new_h == 0:
+            return
+        source = self.pyramid[pick_level(self.pyramid, scale)]
+        resize_separable(source, new_w, new_h, out[:new_h, :new_w])
+
+    def spin(self, base, t, out):
+        scale = zoom_scale(t, self.duration)
+        new_w, new_h = int(scale * self.width), int(scale * self.height)
+        if out is not base:
+            np.copyto(out, base)
+        if new_w == 0 or new_h == 0:
+            return
+
+        # moviepy rotates with expand=True, then squeezes the expanded box into
+        # scale * the original size; both steps are folded into one affine map.
+        matrix, rot_w, rot_h = rotation_matrix(spin_angle(t, self.duration) % 360, self.width, self.height)
+        level = pick_level(self.pyramid, min(new_w / rot_w, new_h / rot_h))
+        source = self.pyramid[level]
+        factor = source.shape[1] / self.width
+
+        xs, ys = pixel_centers(new_w, new_h)
+        px = xs * (rot_w / new_w)
+        py = ys * (rot_h / new_h)
+        a, b, c, d, e, f = matrix
+        src_x = (a * px + b * py + c) * factor
+        src_y = (d * px + e * py + f) * factor
+        sample_bilinear(source, src_x, src_y, out[:new_h, :new_w])
+
+TRANSITION_RENDERERS = {
+    'crossfade': TransitionKernel.crossfade,
+    'slide_left': TransitionKernel.slide,
+    'slide_right': TransitionKernel.slide,
+    'slide_up': TransitionKernel.slide,
+    'slide_down': TransitionKernel.slide,
+    'zoom_in': TransitionKernel.zoom,
+    'spin_in': TransitionKernel.spin,
+}
@@ -1,8 +1,10 @@
 import streamlit as st
 import os
-from src.constants import TRANSITIONS, DEFAULT_SLIDE_DURATION, DEFAULT_TRANSITION_DURATION
-from src.video_processor import process_quick_clip, process_custom_video, generate_preview_transition
-from src.utils import create_slide_image, safe_remove
+import uuid
+from src.constants import TRANSITIONS, MOTIONS, DEFAULT_SLIDE_DURATION, DEFAULT_TRANSITION_DURATION, PREVIEW_FORMATS, TEXT_FONT_SIZE, RENDER_PROFILES, DEFAULT_RENDER_PROFILE, RENDER_QUEUE_POLL_INTERVAL, STORYBOARD_THUMBNAIL_WIDTH
+from src.video_processor import queue_quick_clip, queue_custom_video, generate_preview_transition
+from src.proxies import slide_proxy, make_proxies
+from src.render_queue import RenderQueue, ACTIVE_STATES
 
 # Get absolute path to the project root
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -24,10 +26,122 @@ def render_sidebar():
         st.markdown("---")
         mode = st.radio("Select Mode", ["Quick Clip", "Custom Clip (Wizard)"])
         st.markdown("---")
+        render_storage_usage()
         st.markdown("### About")
         st.info("Professional video creation tool by **Gogi Software**.")
         return mode
 
+def render_storage_usage():
+    """Shows how much disk space the render workspaces of this server use."""
+    usage = get_render_queue().workspaces.usage()
+    with st.expander("Server Storage"):
+        st.progress(min(usage['bytes'] / usage['max_bytes'], 1.0))
+        st.caption(f"{usage['bytes'] / 1024 ** 2:.0f} MB of {usage['max_bytes'] / 1024 ** 2:.0f} MB used by "
+                   f"{usage['workspaces']} renders ({usage['active']} in progress). "
+                   f"{usage['evicted']} old videos removed to make room.")
+
+def render_timing_report(report):
+    """Shows where the time of a render went, one row per stage."""
+    with st.expander(f"Render timing: {report['wall']:.1f}s"):
+        rows = []
+        for stage in report['stages']:
+            latency = stage.get('latency_ms')
+            rows.append({
+                'Stage': stage['stage'],
+                'Wall (s)': stage['wall'],
+                'CPU (s)': stage['cpu'],
+                'Frames': stage['frames'],
+                'FPS': stage['fps'],
+                'p50 / p99 (ms)': f"{latency['p50']} / {latency['p99']}" if latency else '',
+            })
+        st.table(rows)
+        if report['peak_rss_mb']:
+            st.caption(f"Peak memory: {report['peak_rss_mb']:.0f} MB. The ffmpeg encoder runs in a separate process and only shows up as wall time.")
+
+def render_profile_select(key):
+    """Select box for the render profile, described by its size and frame rate."""
+    def describe(name):
+        width, height = RENDER_PROFILES[name]['size']
+        return f"{name.capitalize()} ({width}x{height}, {RENDER_PROFILES[name]['fps']} fps)"
+    names = list(RENDER_PROFILES)
+    return st.selectbox("Render Profile", names, index=names.index(DEFAULT_RENDER_PROFILE),
+                        format_func=describe, key=key)
+
+@st.cache_resource
+def get_render_queue():
+    """The render queue shared by all sessions of this server."""
+    return RenderQueue()
+
+def session_owner():
+    """Identifies this browser session to the render queue."""
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    return st.session_state.session_id
+
+def current_job(mode):
+    """
+    Returns the id of this session's render job for mode ('quick' or 'custom').
+    After a browser refresh the job is picked up again from the page URL.
+    """
+    key = f"{mode}_job"
+    if key not in st.session_state:
+        job_id = st.query_params.get("job")
+        status = get_render_queue().status(job_id)
+        if status is None or status.get('mode') != mode:
+            return None
+        st.session_state[key] = job_id
+    return st.session_state[key]
+
+def start_job(mode, job_id):
+    """Remembers a queued job in the session and in the page URL."""
+    st.session_state[f"{mode}_job"] = job_id
+    st.query_params["job"] = job_id
+
+@st.fragment(run_every=RENDER_QUEUE_POLL_INTERVAL)
+def render_job_progress(job_id):
+    """Polls a queued or running job; reruns the page once it has finished."""
+    render_queue = get_render_queue()
+    status = render_queue.status(job_id)
+    if status is None or status['state'] not in ACTIVE_STATES:
+        st.rerun(scope="app")
+
+    if status['state'] == 'queued':
+        ahead = status.get('position', 0)
+        st.info(f"Waiting in the render queue ({ahead} ahead)." if ahead else "Waiting in the render queue.")
+        if st.button("Cancel Render", key=f"cancel_{job_id}"):
+            render_queue.cancel(job_id)
+            st.rerun(scope="app")
+    else:
+        st.text(status['message'])
+    st.progress(status['progress'])
+
+def render_job(job_id, download_name):
+    """Shows the progress of a render job, or its video once it is done."""
+    render_queue = get_render_queue()
+    status = render_queue.status(job_id)
+    if status is None or (status['state'] == 'done' and not os.path.exists(status['output'])):
+        st.warning("This render is no longer available. Please create the video again.")
+    elif status['state'] in ACTIVE_STATES:
+        render_job_progress(job_id)
+    elif status['state'] == 'done':
+        # Viewing a video keeps it from being evicted for a while
+        render_queue.workspaces.touch(job_id)
+        st.success("Video created successfully!")
+        st.video(status['output'])
+        if status.get('profile'):
+            render_timing_report(status['profile'])
+        with open(status['output'], "rb") as file:
+            st.download_button(
+                label="Download Video",
+                data=file,
+                file_name=download_name,
+                mime="video/mp4"
+            )
+    elif status['state'] == 'cancelled':
+        st.info("The render was cancelled.")
+    else:
+        st.error(f"Error processing video: {status.get('error')}")
+
 def render_quick_clip_page():
     """Renders the Quick Clip interface."""
     st.header("Quick Clip Creator")
@@ -38,29 +152,44 @@ def render_quick_clip_page():
         st.success(f"{len(uploaded_images)} images uploaded.")
         
     uploaded_audio = st.file_uploader("2. Upload Background Music", type=['mp3', 'wav'], key="quick_audio")
+    profile = render_profile_select("quick_profile")
+    collapse_duplicates = st.checkbox("Skip near-duplicate photos", key="quick_collapse_duplicates",
+                                      help="Keeps only the first photo of a burst or of similar shots. "
+                                           "Photos uploaded twice are always processed only once.")
+    sync_to_beats = st.checkbox("Change photos on the beat", key="quick_sync_to_beats",
+                                help="Finds the beat of the music and starts every photo and transition on it.")
     
     if st.button("🚀 Generate Video", key="quick_generate", type="primary"):
         if not uploaded_images or not uploaded_audio:
             st.error("Please upload both images and music.")
             return
             
-        status_text = st.empty()
-        progress_bar = st.progress(0)
-        
-        output_file, audio_temp = process_quick_clip(uploaded_images, uploaded_audio, status_text, progress_bar)
-        
-        if output_file:
-            st.success("Video created successfully!")
-            st.video(output_file)
-            with open(output_file, "rb") as file:
-                st.download_button(
-                    label="Download Video",
-                    data=file,
-                    file_name="gogi_quick_clip.mp4",
-                    mime="video/mp4"
-                )
-            # Cleanup audio temp
-            safe_remove(audio_temp)
+        job_id = queue_quick_clip(get_render_queue(), uploaded_images, uploaded_audio, session_owner(), profile,
+                                  collapse_duplicates, sync_to_beats)
+        if job_id:
+            start_job('quick', job_id)
+
+    job_id = current_job('quick')
+    if job_id:
+        render_job(job_id, "gogi_quick_clip.mp4")
+
+def render_storyboard(slides):
+    """
+    Shows the slides as a strip of thumbnails that scrolls sideways, each with a
+    button that opens the slide in the editor.
+    """
+    with st.container(horizontal=True, wrap=False, gap="small"):
+        for i, slide in enumerate(slides):
+            with st.container(width=STORYBOARD_THUMBNAIL_WIDTH, gap=None):
+                try:
+                    st.image(slide_proxy(slide), width=STORYBOARD_THUMBNAIL_WIDTH)
+                except Exception:
+                    st.caption("No preview")
+                selected = i == st.session_state.current_slide_index
+                if st.button(f"#{i+1} · {float(slide['duration']):g}s", key=f"nav_{i}",
+                             type="primary" if selected else "secondary", use_container_width=True):
+                    st.session_state.current_slide_index = i
+                    st.rerun()
 
 def render_custom_clip_page():
     """Renders the Custom Clip Wizard."""
@@ -75,6 +204,9 @@ def render_custom_clip_page():
         st.session_state.current_slide_index = -1 
     if 'audio_file' not in st.session_state:
         st.session_state.audio_file = None
+    if not st.session_state.slides and current_job('custom'):
+        # Refreshed while a render was running: the slides are gone but the job is not
+        st.session_state.wizard_step = 3
 
     # Step 1: Audio
     if st.session_state.wizard_step == 1:
@@ -124,8 +256,10 @@ def render_custom_clip_page():
                 'duration': DEFAULT_SLIDE_DURATION,
                 'transition': 'crossfade',
                 'transition_duration': DEFAULT_TRANSITION_DURATION,
+                'motion': None,
                 'text': '',
-                'text_color': '#ffffff'
+                'text_color': '#ffffff',
+                'font_size': TEXT_FONT_SIZE
             }
             header_text = "New Slide"
 
@@ -145,10 +279,16 @@ def render_custom_clip_page():
 
             text_overlay = st.text_input("Text Overlay", value=current_slide['text'])
             text_color = st.color_picker("Text Color", value=current_slide['text_color'])
+            font_size = st.slider("Text Size", min_value=20, max_value=240, value=int(current_slide.get('font_size') or TEXT_FONT_SIZE))
             
             st.markdown("#### Timing")
             duration = st.number_input("Duration (seconds)", min_value=1.0, value=float(current_slide['duration']))
             
+            st.markdown("#### Motion")
+            motions = ['none'] + list(MOTIONS)
+            motion = st.selectbox("Pan / Zoom", motions, index=motions.index(current_slide.get('motion') or 'none'),
+                                  help="Slowly pans or zooms the slide while it is shown.")
+            
             st.markdown("#### Transition")
             c_trans, c_prev = st.columns([3, 1])
             with c_trans:
@@ -169,16 +309,24 @@ def render_custom_clip_page():
                         'duration': duration,
                         'transition': transition,
                         'transition_duration': trans_duration,
+                        'motion': None if motion == 'none' else motion,
                         'text': text_overlay,
-                        'text_color': text_color
+                        'text_color': text_color,
+                        'font_size': font_size
                     }
-                    if is_editing:
-                        st.session_state.slides[st.session_state.current_slide_index] = new_data
-                        st.success("Updated!")
+                    try:
+                        # The storyboard and the preview only ever show these small proxies
+                        make_proxies(new_data)
+                    except Exception as e:
+                        st.error(f"Could not read the slide: {e}")
                     else:
-                        st.session_state.slides.append(new_data)
-                        st.success("Added!")
-                        st.rerun()
+                        if is_editing:
+                            st.session_state.slides[st.session_state.current_slide_index] = new_data
+                            st.success("Updated!")
+                        else:
+                            st.session_state.slides.append(new_data)
+                            st.success("Added!")
+                            st.rerun()
                             
             if is_editing:
                 if st.button("Delete Slide", type="secondary", use_container_width=True):
@@ -193,27 +341,31 @@ def render_custom_clip_page():
                 'content': content,
                 'color': color,
                 'text': text_overlay,
-                'text_color': text_color
+                'text_color': text_color,
+                'font_size': font_size
             }
             if preview_data['type'] == 'image' and not preview_data['content']:
                 st.info("Upload image to see preview")
             else:
                 try:
-                    img_preview = create_slide_image(preview_data)
-                    st.image(img_preview, caption="Static Preview", use_container_width=True)
+                    st.image(slide_proxy(preview_data, 'preview'), caption="Static Preview", use_container_width=True)
                 except Exception as e:
                     st.error(str(e))
             
             if is_editing and st.session_state.current_slide_index > 0:
+                 preview_format = st.selectbox("Preview Format", PREVIEW_FORMATS)
                  if st.button("▶ Play Transition"):
                     prev_s = st.session_state.slides[st.session_state.current_slide_index - 1]
                     curr_s = preview_data.copy()
                     curr_s['transition'] = transition
                     curr_s['transition_duration'] = trans_duration
                     
-                    v_path = generate_preview_transition(prev_s, curr_s)
-                    st.video(v_path)
-                    safe_remove(v_path)
+                    # Previews are cached, so the file is kept for the next replay
+                    v_path = generate_preview_transition(prev_s, curr_s, preview_format)
+                    if preview_format == 'mp4':
+                        st.video(v_path)
+                    else:
+                        st.image(v_path, use_container_width=True)
 
         # Slide Strip
         st.markdown("---")
@@ -224,38 +376,24 @@ def render_custom_clip_page():
             st.rerun()
             
         if st.session_state.slides:
-            cols = st.columns(min(len(st.session_state.slides), 8))
-            for i, slide in enumerate(st.session_state.slides):
-                label = f"#{i+1}"
-                if i < len(cols):
-                     with cols[i]:
-                        if st.button(label, key=f"nav_{i}", type="primary" if i == st.session_state.current_slide_index else "secondary"):
-                            st.session_state.current_slide_index = i
-                            st.rerun()
+            render_storyboard(st.session_state.slides)
 
     # Step 3: Finish
     elif st.session_state.wizard_step == 3:
         st.subheader("Step 3: Render Video")
-        st.success(f"Ready to render {len(st.session_state.slides)} slides.")
+        if st.session_state.slides:
+            st.success(f"Ready to render {len(st.session_state.slides)} slides.")
         
         if st.button("⬅ Back to Slides"):
              st.session_state.wizard_step = 2
              st.rerun()
              
-        if st.button("🎬 Create Final Video", type="primary"):
-            status_text = st.empty()
-            progress_bar = st.progress(0)
-            
-            output_file, audio_temp = process_custom_video(st.session_state.slides, st.session_state.audio_file, status_text, progress_bar)
-            
-            if output_file:
-                st.success("Video created successfully!")
-                st.video(output_file)
-                with open(output_file, "rb") as file:
-                    st.download_button(
-                        label="Download Video",
-                        data=file,
-                        file_name="gogi_custom_clip.mp4",
-                        mime="video/mp4"
-                    )
-                safe_remove(audio_temp)
+        profile = render_profile_select("custom_profile")
+        if st.session_state.slides and st.button("🎬 Create Final Video", type="primary"):
+            job_id = queue_custom_video(get_render_queue(), st.session_state.slides, st.session_state.audio_file, session_owner(), profile)
+            if job_id:
+                start_job('custom', job_id)
+
+        job_id = current_job('custom')
+        if job_id:
+            render_job(job_id, "gogi_custom_clip.mp4")
@@ -1,14 +1,40 @@
+import math
 import os
+import shutil
 import tempfile
-from PIL import Image, ImageOps, ImageDraw, ImageFont
+from PIL import Image, ImageOps
 import numpy as np
-from src.constants import SCREEN_SIZE
+from src.constants import SCREEN_SIZE, INGEST_QUALITY, INGEST_QUALITY_PROFILES, UPLOAD_CHUNK_SIZE, TEXT_FONT_SIZE
+from src.cache import slide_cache, slide_cache_key
+from src.text import overlay_text
 
-def resize_and_pad_image(image, target_size=SCREEN_SIZE, background_color=(0, 0, 0)):
+EXIF_ORIENTATION = 0x0112
+
+def request_draft(image, target_size, oversample):
+    """
+    Asks the decoder for a reduced-resolution decode (JPEG DCT scaling) that still
+    covers oversample times the size the image will be resized to.
+    Must be called before the image is loaded; other formats ignore it.
+    """
+    width, height = image.size
+    # The target is in display orientation, the decoder works in stored orientation
+    rotated = image.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8)
+    display_width, display_height = (height, width) if rotated else (width, height)
+    scale = min(target_size[0] / display_width, target_size[1] / display_height) * oversample
+    if scale >= 1:
+        return
+    image.draft(None, (math.ceil(width * scale), math.ceil(height * scale)))
+
+def resize_and_pad_image(image, target_size=SCREEN_SIZE, background_color=(0, 0, 0), quality=INGEST_QUALITY):
     """
     Resizes an image to fit within target_size while maintaining aspect ratio.
     Pads with background_color to fill the target_size.
+    quality selects an entry of INGEST_QUALITY_PROFILES.
     """
+    profile = INGEST_QUALITY_PROFILES[quality]
+    if profile['draft_oversample']:
+        request_draft(image, target_size, profile['draft_oversample'])
+
     img = ImageOps.exif_transpose(image)
     target_width, target_height = target_size
     target_ratio = target_width / target_height
@@ -23,7 +49,7 @@ def resize_and_pad_image(image, target_size=SCREEN_SIZE, background_color=(0, 0,
         new_height = target_height
         new_width = int(target_height * img_ratio)
         
-    img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+    img = img.resize((new_width, new_height), Image.Resampling[profile['resample'].upper()])
     
     # Create background
     background = Image.new('RGB', target_size, background_color)
@@ -35,58 +61,72 @@ def resize_and_pad_image(image, target_size=SCREEN_SIZE, background_color=(0, 0,
     
     return background
 
-def create_slide_image(slide_data):
+def create_slide_image(slide_data, target_size=SCREEN_SIZE, cache=True):
     """
     Creates a numpy array image for a given slide data dictionary.
+    Results are cached by content and render parameters; the returned array is read-only.
+    The picture without its text is cached as well, so a text edit only blends a new
+    text sprite over it.
+    With cache=False an already cached array is still returned, but a new one is not
+    stored, so a long render does not keep every slide alive in the cache.
     """
-    # Create base image
-    if slide_data['type'] == 'image':
-        # Reset file pointer if it's a file-like object (UploadedFile)
-        if hasattr(slide_data['content'], 'seek'):
-            slide_data['content'].seek(0)
-            
-        img = Image.open(slide_data['content'])
-        # Use helper function
-        img = resize_and_pad_image(img)
-    else:
-        # Solid color
-        color = slide_data['color']
-        img = Image.new('RGB', SCREEN_SIZE, color)
-    
-    # Add Text Overlay
-    if slide_data.get('text'):
-        draw = ImageDraw.Draw(img)
-        try:
-            # Try to use a better default font if available, else default
-            font = ImageFont.truetype("arial.ttf", 80)
-        except:
-            font = ImageFont.load_default()
-            
-        text = slide_data['text']
-        text_color = slide_data.get('text_color', '#ffffff')
-        
-        # Simple centering
-        # In newer Pillow versions, textbbox is preferred but keeping simple for compatibility
-        w = SCREEN_SIZE[0]
-        h = SCREEN_SIZE[1]
-        draw.text((w/2, h/2), text, font=font, fill=text_color, anchor="mm")
-        
-    return np.array(img)
+    cache_key = slide_cache_key(slide_data, target_size)
+    cached = slide_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # The slide without text: type, source and color
+    base_key = cache_key[:3] + (tuple(target_size),)
+    base = slide_cache.get(base_key)
+    if base is None:
+        if slide_data['type'] == 'image':
+            # Reset file pointer if it's a file-like object (UploadedFile)
+            if hasattr(slide_data['content'], 'seek'):
+                slide_data['content'].seek(0)
+
+            img = Image.open(slide_data['content'])
+            img = resize_and_pad_image(img, target_size)
+        else:
+            # Solid color
+            img = Image.new('RGB', target_size, slide_data['color'])
+        base = np.array(img)
+        base.flags.writeable = False
+        if cache:
+            slide_cache.put(base_key, base)
+
+    if not slide_data.get('text'):
+        return base
+
+    # Font size is relative to the full-size render so smaller targets keep the same layout
+    font_size = max(1, int(slide_data.get('font_size') or TEXT_FONT_SIZE) * target_size[1] // SCREEN_SIZE[1])
+    img_array = overlay_text(base, slide_data['text'], slide_data.get('text_color', '#ffffff'),
+                             font_size, slide_data.get('font'))
+    img_array.flags.writeable = False
+    if cache:
+        slide_cache.put(cache_key, img_array)
+    return img_array
 
-def save_uploaded_file(uploaded_file):
+def save_uploaded_file(uploaded_file, directory=None):
     """
-    Saves an uploaded file to a temporary file and returns the path.
+    Saves an uploaded file to a temporary file in directory (default: the system
+    temp directory) and returns the path, or None if it could not be saved.
+    The upload is copied in chunks so it is never duplicated in memory.
     """
     if uploaded_file is None:
         return None
         
+    path = None
     try:
         suffix = f".{uploaded_file.name.split('.')[-1]}"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tfile:
-            tfile.write(uploaded_file.read())
-            return tfile.name
+        if hasattr(uploaded_file, 'seek'):
+            uploaded_file.seek(0)
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=directory) as tfile:
+            path = tfile.name
+            shutil.copyfileobj(uploaded_file, tfile, UPLOAD_CHUNK_SIZE)
+        return path
     except Exception as e:
         print(f"Error saving file: {e}")
+        safe_remove(path)
         return None
 
 def safe_remove(path):
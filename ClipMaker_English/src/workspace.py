@@ -0,0 +1,198 @@
+import os
+import shutil
+import threading
+import uuid
+
+from src.constants import WORKSPACE_DIR, WORKSPACE_SCRATCH_DIR, WORKSPACE_MAX_BYTES
+
+# Every render gets its own workspace, so concurrent renders never share a file
+# name. Uploads and render intermediates are deleted as soon as the render ends,
+# whatever the outcome; the finished video and the job status stay until the
+# manager evicts the least recently used workspaces to stay within its budget.
+# A workspace is "active" while its render runs and is never evicted then.
+
+ACTIVE_MARKER = ".active"
+
+def directory_size(path):
+    """Total size in bytes of the files below path."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+class Workspace:
+    """
+    The directories of one render:
+    directory holds the artifacts (the finished video, the job status),
+    inputs the saved uploads and scratch the intermediates (on tmpfs when available,
+    for renders whose segments fit, see renderer.scratch_directory).
+    Used as a context manager, the render ends when the block exits; if it raised,
+    the artifacts are discarded too.
+    """
+
+    def __init__(self, job_id, directory, scratch):
+        self.job_id = job_id
+        self.directory = directory
+        self.inputs = os.path.join(directory, "inputs")
+        self.scratch = scratch
+
+    def artifact_path(self, name):
+        return os.path.join(self.directory, name)
+
+    def finish(self):
+        """Deletes the uploads and intermediates and makes the workspace evictable."""
+        shutil.rmtree(self.inputs, ignore_errors=True)
+        shutil.rmtree(self.scratch, ignore_errors=True)
+        try:
+            os.remove(os.path.join(self.directory, ACTIVE_MARKER))
+        except OSError:
+            pass
+
+    def discard(self, keep=()):
+        """
+        Deletes the whole workspace, e.g. after a failed or cancelled render,
+        except the files named in keep (e.g. a status file recording the failure).
+        """
+        self.finish()
+        if not keep:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            return
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.name in keep:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.finish()
+        else:
+            self.discard()
+
+class WorkspaceManager:
+    """
+    Allocates workspaces under directory (scratch under scratch_directory) and
+    keeps the finished ones within max_bytes, evicting the least recently used.
+    A workspace counts as used when it is written to or touch()ed.
+    """
+
+    def __init__(self, directory=WORKSPACE_DIR, scratch_directory=WORKSPACE_SCRATCH_DIR, max_bytes=WORKSPACE_MAX_BYTES):
+        self.directory = directory
+        self.scratch_directory = scratch_directory
+        self.max_bytes = max_bytes
+        self.evicted = 0
+        self.evicted_bytes = 0
+        self.lock = threading.Lock()
+
+    def workspace(self, job_id):
+        return Workspace(job_id, os.path.join(self.directory, job_id), os.path.join(self.scratch_directory, job_id))
+
+    def create(self, job_id=None):
+        """Allocates an active workspace, making room for it first."""
+        self.trim()
+        workspace = self.workspace(job_id or uuid.uuid4().hex[:16])
+        os.makedirs(workspace.inputs)
+        os.makedirs(workspace.scratch, exist_ok=True)
+        open(os.path.join(workspace.directory, ACTIVE_MARKER), "w").close()
+        return workspace
+
+    def get(self, job_id):
+        """Returns the workspace of job_id, or None if it does not exist (any more)."""
+        if not job_id or not job_id.isalnum():
+            return None
+        workspace = self.workspace(job_id)
+        return workspace if os.path.isdir(workspace.directory) else None
+
+    def touch(self, job_id):
+        """Marks a workspace as recently used, e.g. when its video is viewed."""
+        workspace = self.get(job_id)
+        if workspace:
+            try:
+                os.utime(workspace.directory)
+            except OSError:
+                pass
+
+    def entries(self):
+        """(last used, bytes, active, job id) of every workspace, least recently used first."""
+        entries = []
+        try:
+            listing = list(os.scandir(self.directory))
+        except OSError:
+            return entries
+        for entry in listing:
+            if not entry.is_dir():
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            active = os.path.exists(os.path.join(entry.path, ACTIVE_MARKER))
+            entries.append((mtime, directory_size(entry.path), active, entry.name))
+        entries.sort()
+        return entries
+
+    def trim(self):
+        """Deletes the least recently used finished workspaces until the budget is met."""
+        with self.lock:
+            entries = self.entries()
+            total = sum(size for _, size, _, _ in entries)
+            for _, size, active, job_id in entries:
+                if total <= self.max_bytes:
+                    break
+                if active:
+                    continue
+                self.workspace(job_id).discard()
+                total -= size
+                self.evicted += 1
+                self.evicted_bytes += size
+
+    def sweep(self, keep=()):
+        """
+        Deletes the scratch directories and unfinished workspaces left behind by
+        a previous server process, with any partial output and temporary
+        directories of their renders, except the files named in keep.
+        Call it at startup, before any render runs.
+        """
+        for _, _, active, job_id in self.entries():
+            if active:
+                self.workspace(job_id).discard(keep)
+        shutil.rmtree(self.scratch_directory, ignore_errors=True)
+
+    def usage(self):
+        """Returns the number of workspaces, their disk usage and the eviction counters."""
+        entries = self.entries()
+        scratch_bytes = directory_size(self.scratch_directory)
+        usage = {
+            'workspaces': len(entries),
+            'active': sum(1 for _, _, active, _ in entries if active),
+            'bytes': sum(size for _, size, _, _ in entries),
+            'max_bytes': self.max_bytes,
+            'scratch_bytes': scratch_bytes,
+            'evicted': self.evicted,
+            'evicted_bytes': self.evicted_bytes,
+        }
+        for name, path in (('disk_free_bytes', self.directory), ('scratch_free_bytes', self.scratch_directory)):
+            try:
+                usage[name] = shutil.disk_usage(path).free
+            except OSError:
+                usage[name] = None
+        return usage
+
+# Workspaces of this server's renders
+workspaces = WorkspaceManager()